@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+"""
+Local HTTP API for the Screen Context GPT Assistant.
+Serves many independent conversations from one process: every session has
+its own ScreenAssistantCore (history, router state, compaction) while the
+OpenAI client and its connection pool are shared. Questions come with an
+uploaded screenshot or ask the server to capture its own screen.
+
+Load is kept predictable by admission control: a global cap on upstream
+requests in flight with a bounded, time-limited wait queue (503 when full),
+a per-session concurrency limit (429) and a cap on open sessions.
+
+Endpoints:
+    GET    /v1/health
+    GET    /v1/stats
+    GET    /v1/sessions                     list sessions
+    POST   /v1/sessions                     create a session
+    GET    /v1/sessions/{id}                session details
+    DELETE /v1/sessions/{id}                end a session
+    POST   /v1/sessions/{id}/reset          clear its conversation
+    POST   /v1/sessions/{id}/ask            {"question", "image" | "capture"} -> answer
+    POST   /v1/sessions/{id}/stream         same, answered as server-sent events
+"""
+
+import argparse
+import base64
+import binascii
+import hmac
+import io
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+from capture_region import CaptureSettings
+from capture_worker import CaptureWorker, EncodedFrame
+from frame_buffer import frame_signature
+from request_control import CancelToken
+from request_hedging import HedgePolicy
+from screen_assistant_gui import ScreenAssistantCore, create_client
+
+
+class ApiError(Exception):
+    """An error reported to the API client with an HTTP status."""
+
+    def __init__(self, status: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Global cap on in-flight upstream requests with a bounded wait queue."""
+
+    def __init__(self, max_in_flight: int = 8, max_queued: int = 32, queue_timeout: float = 30.0):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        """Hold one upstream slot; raises ApiError(503) if none frees up in time."""
+        with self._cond:
+            if self.in_flight >= self.max_in_flight:
+                if self.queued >= self.max_queued:
+                    self.rejected += 1
+                    raise ApiError(503, "Server is at capacity", retry_after=1)
+                self.queued += 1
+                deadline = time.monotonic() + self.queue_timeout
+                try:
+                    while self.in_flight >= self.max_in_flight:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.rejected += 1
+                            raise ApiError(503, "Timed out waiting for capacity", retry_after=1)
+                        self._cond.wait(remaining)
+                finally:
+                    self.queued -= 1
+            self.in_flight += 1
+            self.admitted += 1
+        try:
+            yield
+        finally:
+            self.release()
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free right now (for optional work such as hedges)."""
+        with self._cond:
+            if self.in_flight >= self.max_in_flight or self.queued:
+                return False
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+    def release(self):
+        """Free a slot taken with try_acquire() (slot() frees its own)."""
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+
+@dataclass
+class ApiSession:
+    """One client's conversation."""
+    id: str
+    core: ScreenAssistantCore
+    created: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+    active: int = 0
+    turns: int = 0
+
+    def describe(self) -> dict:
+        return {
+            "id": self.id,
+            "created": self.created,
+            "last_used": self.last_used,
+            "active": self.active,
+            "turns": self.turns,
+            "session_version": self.core.session_version,
+            "latency": self.core.latency.status() if self.core.latency else None,
+        }
+
+
+class AssistantServer:
+    """Session registry, admission control and the shared capture engine."""
+
+    def __init__(self, max_sessions: int = 256, session_concurrency: int = 1,
+                 session_ttl: float = 3600.0, admission: Optional[AdmissionController] = None):
+        self.client = create_client(keepalive_expiry=60.0)
+        self.max_sessions = max_sessions
+        self.session_concurrency = session_concurrency
+        self.session_ttl = session_ttl
+        self.admission = admission or AdmissionController()
+        self.started = time.time()
+        self.latencies = deque(maxlen=1000)
+        self._sessions: Dict[str, ApiSession] = {}
+        self._lock = threading.Lock()
+        # Encoding is CPU-bound; more concurrent encodes than cores only adds latency
+        self._prepare_slots = threading.BoundedSemaphore(os.cpu_count() or 2)
+        self._capture_lock = threading.Lock()
+        # One hedging policy for all sessions: they share the same upstream. A
+        # hedge is a second live request, so it needs its own admission slot
+        self.hedging = HedgePolicy.from_env()
+        if self.hedging:
+            self.hedging.admission = self.admission
+        self.capture_worker = None
+        if os.getenv("CAPTURE_WORKER", "false").lower() == "true":
+            self.capture_worker = CaptureWorker()
+            self.capture_worker.start()
+
+    @classmethod
+    def from_env(cls) -> "AssistantServer":
+        """
+        Create a server from API_MAX_SESSIONS, API_SESSION_CONCURRENCY,
+        API_SESSION_TTL, API_MAX_IN_FLIGHT, API_MAX_QUEUED and API_QUEUE_TIMEOUT.
+        """
+        return cls(
+            max_sessions=int(os.getenv("API_MAX_SESSIONS", "256")),
+            session_concurrency=int(os.getenv("API_SESSION_CONCURRENCY", "1")),
+            session_ttl=float(os.getenv("API_SESSION_TTL", "3600")),
+            admission=AdmissionController(
+                max_in_flight=int(os.getenv("API_MAX_IN_FLIGHT", "8")),
+                max_queued=int(os.getenv("API_MAX_QUEUED", "32")),
+                queue_timeout=float(os.getenv("API_QUEUE_TIMEOUT", "30")),
+            ),
+        )
+
+    # --- sessions ----------------------------------------------------------
+
+    def create_session(self) -> ApiSession:
+        self.expire_sessions()
+        with self._lock:
+            if len(self._sessions) >= self.max_sessions:
+                raise ApiError(503, "Too many open sessions", retry_after=60)
+            core = ScreenAssistantCore(self.client, helpers=False)
+            core.hedging = self.hedging
+            if core.compactor:
+                # Summary requests count against the global in-flight cap too
+                core.compactor.slot = self.admission.slot
+            session = ApiSession(uuid.uuid4().hex, core)
+            self._sessions[session.id] = session
+            return session
+
+    def get_session(self, session_id: str) -> ApiSession:
+        with self._lock:
+            session = self._sessions.get(session_id)
+        if session is None:
+            raise ApiError(404, f"Unknown session {session_id}")
+        return session
+
+    def list_sessions(self) -> List[ApiSession]:
+        with self._lock:
+            return list(self._sessions.values())
+
+    def delete_session(self, session_id: str):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            raise ApiError(404, f"Unknown session {session_id}")
+        session.core.cancel_pending()
+        session.core.close()
+
+    def reset_session(self, session: ApiSession):
+        """Clear a session's conversation, cancelling its question in progress."""
+        session.core.reset_conversation()
+        with self._lock:
+            session.turns = 0
+
+    def expire_sessions(self):
+        """Drop sessions that have been idle for longer than the TTL."""
+        cutoff = time.time() - self.session_ttl
+        with self._lock:
+            expired = [s for s in self._sessions.values() if s.active == 0 and s.last_used < cutoff]
+            for session in expired:
+                del self._sessions[session.id]
+        for session in expired:
+            session.core.close()
+
+    @contextmanager
+    def use(self, session: ApiSession):
+        """Count a request against the session's concurrency limit."""
+        with self._lock:
+            if session.active >= self.session_concurrency:
+                raise ApiError(429, "This session already has a question in progress", retry_after=1)
+            session.active += 1
+            session.last_used = time.time()
+        try:
+            yield
+        finally:
+            with self._lock:
+                session.active -= 1
+                session.last_used = time.time()
+
+    # --- questions ---------------------------------------------------------
+
+    def screenshot(self, body: dict):
+        """The uploaded image, or a capture of this machine's screen."""
+        if body.get("image"):
+            try:
+                data = base64.b64decode(body["image"], validate=True)
+                image = Image.open(io.BytesIO(data))
+                image.load()
+            except (binascii.Error, ValueError, OSError) as e:
+                raise ApiError(400, f"Invalid image: {e}")
+            if image.format == "JPEG" and image.mode == "RGB":
+                # Already what the model gets; skip re-encoding
+                return EncodedFrame(base64.b64encode(data).decode("ascii"), image.size, frame_signature(image))
+            return image
+        capture = body.get("capture")
+        if not capture:
+            raise ApiError(400, 'Send an "image" (base64) or "capture": true')
+        settings = CaptureSettings()
+        if isinstance(capture, dict):
+            try:
+                region = capture.get("region")
+                if isinstance(region, (list, tuple)):
+                    region = ",".join(str(v) for v in region)
+                settings = CaptureSettings.from_env(capture.get("mode"), region)
+            except ValueError as e:
+                raise ApiError(400, str(e))
+        with self._capture_lock:
+            if self.capture_worker:
+                screenshot = self.capture_worker.capture(settings)
+            else:
+                import mss
+                with mss.mss() as sct:
+                    grab = sct.grab(settings.resolve(sct.monitors))
+                    screenshot = Image.frombytes("RGB", grab.size, grab.bgra, "raw", "BGRX")
+        if screenshot is None:
+            raise ApiError(500, "Failed to capture screen")
+        return screenshot
+
+    def ask(self, session: ApiSession, body: dict, on_delta=None, token: Optional[CancelToken] = None) -> dict:
+        """Answer a question in a session; blocks until admitted and answered."""
+        question = body.get("question")
+        if not isinstance(question, str) or not question.strip():
+            raise ApiError(400, 'A non-empty "question" is required')
+        started = time.perf_counter()
+        with self.use(session):
+            screenshot = self.screenshot(body)
+            with self._prepare_slots:
+                prepared = session.core.prepare_question(question, screenshot)
+            with self.admission.slot():
+                answer = session.core.send_prepared(prepared, token, on_delta)
+        if answer is None:
+            if token is not None and token.cancelled:
+                raise ApiError(499, "Request cancelled")
+            raise ApiError(502, "Failed to get a response from the model")
+        with self._lock:
+            session.turns += 1
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies.append(elapsed)
+        return {
+            "answer": answer,
+            "route": asdict(prepared.route),
+            "timings": {name: round(seconds, 4) for name, seconds in prepared.timings.items()},
+            "latency": round(elapsed, 4),
+            "session_version": prepared.session_version,
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = sorted(self.latencies)
+
+        def percentile(p):
+            return round(latencies[min(int(p * len(latencies)), len(latencies) - 1)], 4) if latencies else None
+
+        admission = self.admission
+        with self._lock:
+            sessions = len(self._sessions)
+            active = sum(s.active for s in self._sessions.values())
+        return {
+            "uptime": round(time.time() - self.started, 1),
+            "sessions": sessions,
+            "active_questions": active,
+            "in_flight": admission.in_flight,
+            "queued": admission.queued,
+            "admitted": admission.admitted,
+            "rejected": admission.rejected,
+            "limits": {
+                "max_sessions": self.max_sessions,
+                "session_concurrency": self.session_concurrency,
+                "max_in_flight": admission.max_in_flight,
+                "max_queued": admission.max_queued,
+            },
+            "latency": {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99)},
+            "hedging": self.hedging.stats() if self.hedging else None,
+        }
+
+    def close(self):
+        for session in self.list_sessions():
+            session.core.cancel_pending()
+            session.core.close()
+        if self.capture_worker:
+            self.capture_worker.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "ScreenAssistantAPI/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    @property
+    def assistant(self) -> AssistantServer:
+        return self.server.assistant
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+    def _route(self, method: str):
+        try:
+            self._authorize()
+            # Read the body before any other error reply so the connection stays reusable
+            body = self._body() if method == "POST" else {}
+            parts = [p for p in self.path.split("?")[0].split("/") if p]
+            if parts[:1] != ["v1"]:
+                raise ApiError(404, f"Unknown path {self.path}")
+            self._dispatch(method, parts[1:], body)
+        except ApiError as e:
+            self._json(e.status, {"error": {"message": str(e)}}, e.retry_after)
+        except Exception as e:
+            self._json(500, {"error": {"message": str(e)}})
+
+    def _authorize(self):
+        token = self.server.token
+        if not token:
+            return
+        given = self.headers.get("Authorization", "").encode("utf-8", "surrogateescape")
+        if not hmac.compare_digest(given, f"Bearer {token}".encode()):
+            # The body of an unauthorized request is never read; drop it with the connection
+            self.close_connection = True
+            raise ApiError(401, "Missing or invalid bearer token")
+
+    def _dispatch(self, method: str, parts: List[str], body: dict):
+        assistant = self.assistant
+        if parts == ["health"] and method == "GET":
+            return self._json(200, {"ok": True})
+        if parts == ["stats"] and method == "GET":
+            return self._json(200, assistant.stats())
+        if parts == ["sessions"]:
+            if method == "GET":
+                return self._json(200, {"sessions": [s.describe() for s in assistant.list_sessions()]})
+            if method == "POST":
+                return self._json(201, assistant.create_session().describe())
+        if len(parts) >= 2 and parts[0] == "sessions":
+            session = assistant.get_session(parts[1])
+            action = parts[2] if len(parts) == 3 else None
+            if len(parts) == 2 and method == "GET":
+                return self._json(200, session.describe())
+            if len(parts) == 2 and method == "DELETE":
+                assistant.delete_session(session.id)
+                return self._json(200, {"ok": True})
+            if action == "reset" and method == "POST":
+                assistant.reset_session(session)
+                return self._json(200, session.describe())
+            if action == "ask" and method == "POST":
+                return self._json(200, assistant.ask(session, body))
+            if action == "stream" and method == "POST":
+                return self._stream(session, body)
+        raise ApiError(404 if method == "GET" else 405, f"No {method} handler for {self.path}")
+
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        if length > self.server.max_body:
+            self.close_connection = True
+            raise ApiError(413, f"Request body larger than {self.server.max_body} bytes")
+        raw = self.rfile.read(length)
+        try:
+            body = json.loads(raw) if raw else {}
+        except ValueError:
+            raise ApiError(400, "Request body is not valid JSON")
+        if not isinstance(body, dict):
+            raise ApiError(400, "Request body must be a JSON object")
+        return body
+
+    def _json(self, status: int, payload: dict, retry_after: Optional[float] = None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if retry_after is not None:
+            self.send_header("Retry-After", str(int(retry_after)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, session: ApiSession, body: dict):
+        """Answer as server-sent events; a client that disconnects cancels the request."""
+        token = CancelToken()
+        started = []
+
+        def event(payload: dict):
+            if not started:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                started.append(True)
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode())
+            self.wfile.flush()
+
+        def on_delta(text):
+            try:
+                event({"delta": text})
+            except OSError:
+                token.cancel()
+
+        self.close_connection = True
+        try:
+            result = self.assistant.ask(session, body, on_delta, token)
+            event(dict(result, done=True))
+        except ApiError as e:
+            if not started:
+                raise
+            try:
+                event({"error": {"message": str(e)}, "done": True})
+            except OSError:
+                pass
+        except OSError:
+            token.cancel()
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+def main():
+    """Entry point for the API server."""
+    parser = argparse.ArgumentParser(description="Screen Context GPT Assistant (local multi-session API)")
+    parser.add_argument("--host", default=os.getenv("API_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8700")))
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    token = os.getenv("API_TOKEN")
+    if args.host not in ("127.0.0.1", "localhost", "::1") and not token:
+        print("Refusing to listen beyond localhost without API_TOKEN set.")
+        return
+
+    try:
+        assistant = AssistantServer.from_env()
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+
+    httpd = _HTTPServer((args.host, args.port), _Handler)
+    httpd.assistant = assistant
+    httpd.token = token
+    httpd.verbose = args.verbose
+    httpd.max_body = int(float(os.getenv("API_MAX_BODY_MB", "20")) * 1024 * 1024)
+
+    limits = assistant.stats()["limits"]
+    print(f"Screen Assistant API listening on http://{args.host}:{args.port}/v1 "
+          f"({limits['max_in_flight']} upstream requests in flight, {limits['max_sessions']} sessions max)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        assistant.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Thin client for the Screen Context GPT Assistant daemon.
+Talks to a running `screen-assistant-daemon` over a Unix domain socket and
+only uses the standard library, so it starts in a few tens of milliseconds;
+the daemon keeps the OpenAI client, connections, capture engine and the
+conversation resident between invocations.
+
+Protocol: one request per connection. The client sends a JSON object with an
+"op" field on a single line; the daemon answers with JSON lines. Streaming
+operations send {"delta": ...} lines before the final reply, and closing the
+connection early cancels the request.
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Iterator, Optional
+
+
+def default_socket_path() -> str:
+    """ASSISTANT_SOCKET, or a per-user socket in the runtime directory."""
+    path = os.getenv("ASSISTANT_SOCKET")
+    if path:
+        return path
+    runtime = os.getenv("XDG_RUNTIME_DIR")
+    if runtime and os.path.isdir(runtime):
+        return os.path.join(runtime, "screen-assistant.sock")
+    return os.path.join(tempfile.gettempdir(), f"screen-assistant-{os.getuid()}.sock")
+
+
+class DaemonError(Exception):
+    """The daemon reported an error."""
+
+
+class DaemonUnavailable(DaemonError):
+    """No daemon is listening on the socket."""
+
+
+class DaemonStream:
+    """Replies of a streaming request; close() cancels it on the daemon."""
+
+    def __init__(self, sock: socket.socket):
+        self._sock = sock
+        self._file = sock.makefile("rb")
+
+    def __iter__(self) -> Iterator[dict]:
+        try:
+            for line in self._file:
+                yield json.loads(line)
+        except (OSError, ValueError):
+            # Closed from another thread to cancel the request
+            return
+
+    def close(self):
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._file.close()
+        self._sock.close()
+
+
+class DaemonClient:
+    """Sends requests to the assistant daemon."""
+
+    def __init__(self, path: Optional[str] = None, timeout: float = 30.0):
+        self.path = path or default_socket_path()
+        self.timeout = timeout
+
+    def _connect(self, timeout: Optional[float]) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(self.path)
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            sock.close()
+            raise DaemonUnavailable(f"No assistant daemon at {self.path}") from e
+        return sock
+
+    def stream(self, op: str, timeout: Optional[float] = None, **params) -> DaemonStream:
+        """Send a request and return its stream of replies (no timeout by default)."""
+        sock = self._connect(self.timeout)
+        sock.sendall(json.dumps(dict(params, op=op)).encode() + b"\n")
+        sock.settimeout(timeout)
+        return DaemonStream(sock)
+
+    def call(self, op: str, **params) -> dict:
+        """Send a request and return its final reply; raises DaemonError on failure."""
+        stream = self.stream(op, timeout=self.timeout, **params)
+        try:
+            reply = None
+            for reply in stream:
+                pass
+        finally:
+            stream.close()
+        if reply is None:
+            raise DaemonError(f"No reply from the assistant daemon to {op!r}")
+        if not reply.get("ok"):
+            raise DaemonError(reply.get("error", "unknown error"))
+        return reply
+
+    def running(self) -> bool:
+        try:
+            self.call("status")
+            return True
+        except DaemonUnavailable:
+            return False
+
+    def spawn(self, wait: float = 20.0, args=()) -> bool:
+        """Start a daemon in the background and wait until it answers."""
+        subprocess.Popen(
+            [sys.executable, "-m", "assistant_daemon", "--socket", self.path, *args],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            if self.running():
+                return True
+            time.sleep(0.1)
+        return False
+
+
+def ask(client: DaemonClient, question: str, settings: Optional[dict]) -> Optional[str]:
+    """Ask a question, printing the answer as it streams in; Ctrl+C cancels it."""
+    stream = client.stream("ask", question=question, settings=settings)
+    reply = None
+    try:
+        for reply in stream:
+            if "delta" in reply:
+                sys.stdout.write(reply["delta"])
+                sys.stdout.flush()
+    except KeyboardInterrupt:
+        print("\n[cancelled]")
+        return None
+    finally:
+        stream.close()
+    print()
+    if reply is None or not reply.get("ok"):
+        print(f"Error: {reply.get('error') if reply else 'no reply from daemon'}")
+        return None
+    return reply.get("answer")
+
+
+def question_settings(args) -> Optional[dict]:
+    """Capture settings to send with each question, or None for the daemon's own."""
+    settings = {}
+    if args.capture_mode or args.region:
+        settings = {"mode": args.capture_mode or "region", "region": args.region}
+    # In window mode the daemon must not capture the terminal the question is typed in
+    from capture_region import terminal_window
+    terminal = terminal_window()
+    if terminal:
+        settings["exclude"] = [terminal]
+    return settings or None
+
+
+def main():
+    """Entry point for the thin client."""
+    parser = argparse.ArgumentParser(description="Screen Context GPT Assistant (daemon client)")
+    parser.add_argument("question", nargs="*", help="ask this question and exit")
+    parser.add_argument("--socket", help="daemon socket path")
+    parser.add_argument("--start", action="store_true", help="start the daemon if it is not running")
+    parser.add_argument("--status", action="store_true", help="show daemon status")
+    parser.add_argument("--reset", action="store_true", help="reset the conversation")
+    parser.add_argument("--stop", action="store_true", help="stop the daemon")
+    parser.add_argument("--capture-mode", help="which part of the screen to capture")
+    parser.add_argument("--region", metavar="X,Y,W,H", help="rectangle to capture")
+    args = parser.parse_args()
+
+    client = DaemonClient(args.socket)
+    if not client.running():
+        if not args.start:
+            print(f"No assistant daemon at {client.path}.")
+            print("Start one with `screen-assistant-daemon` or pass --start.")
+            sys.exit(1)
+        print("Starting assistant daemon...")
+        if not client.spawn():
+            print("The daemon did not start; run `screen-assistant-daemon` to see why.")
+            sys.exit(1)
+
+    try:
+        if args.stop:
+            client.call("shutdown")
+            print("Daemon stopped.")
+            return
+        if args.reset:
+            client.call("reset")
+            print("Conversation reset.")
+        if args.status:
+            status = client.call("status")
+            print(f"pid {status['pid']}, up {status['uptime']:.0f}s, {status['turns']} turn(s) in session "
+                  f"{status['session_version']}, {status['requests']} request(s) served, "
+                  f"capturing {status['capture']}")
+            if status.get("latency"):
+                print(f"image: {status['latency']}")
+            if status.get("hedging"):
+                print(status["hedging"])
+        if not args.question and (args.reset or args.status):
+            return
+        settings = question_settings(args)
+        if args.question:
+            ask(client, " ".join(args.question), settings)
+            return
+
+        # Interactive loop
+        while True:
+            try:
+                question = input("What would you like to know? ").strip()
+            except (EOFError, KeyboardInterrupt):
+                print()
+                break
+            if question.lower() in ("quit", "exit", "q"):
+                break
+            if question.lower() == "reset":
+                client.call("reset")
+                print("Conversation reset.")
+                continue
+            if question:
+                ask(client, question, settings)
+    except DaemonError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Resident daemon for the Screen Context GPT Assistant.
+Keeps the OpenAI client and its pooled connections, the capture engine and
+the conversation in one long-running process, so front ends (the
+`screen-assistant-client` CLI and `screen-assistant-gui --daemon`) start
+instantly and the session survives restarting them.
+
+See assistant_client.py for the protocol.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, replace
+from typing import Optional
+
+from assistant_client import DaemonClient, default_socket_path
+from capture_region import CAPTURE_MODES, CaptureSettings
+from request_control import CancelToken
+from screen_assistant_gui import ScreenAssistantCore, create_client
+
+# Captured frames and prepared questions waiting for their next step; the
+# oldest are dropped if a front end disappears between steps
+MAX_WAITING = 16
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+            op = request.pop("op")
+            handler = getattr(self.server.daemon, f"op_{op}", None)
+            if handler is None:
+                raise ValueError(f"Unknown operation {op!r}")
+            reply = handler(self, **request)
+        except Exception as e:
+            reply = {"ok": False, "error": str(e)}
+        self.send(reply)
+
+    def send(self, message: dict) -> bool:
+        try:
+            self.wfile.write(json.dumps(message).encode() + b"\n")
+            self.wfile.flush()
+            return True
+        except OSError:
+            return False
+
+    def watch_disconnect(self, token: CancelToken):
+        """Cancel the request if the front end closes the connection."""
+        def watch():
+            try:
+                while self.request.recv(1024):
+                    pass
+            except OSError:
+                pass
+            token.cancel()
+        threading.Thread(target=watch, daemon=True).start()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class AssistantDaemon:
+    """Serves ScreenAssistantCore to thin clients over a Unix domain socket."""
+
+    def __init__(self, core: ScreenAssistantCore, path: str, keepalive: float = 45.0):
+        self.core = core
+        self.path = path
+        self.keepalive = keepalive
+        self.started = time.time()
+        self.requests = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._frames = OrderedDict()
+        self._prepared = OrderedDict()
+        self._last_request = time.monotonic()
+        self._stop = threading.Event()
+        self._server = None
+
+    # --- lifecycle ---------------------------------------------------------
+
+    def serve(self):
+        """Listen until shut down."""
+        if os.path.exists(self.path):
+            if DaemonClient(self.path).running():
+                raise RuntimeError(f"An assistant daemon is already running at {self.path}")
+            os.unlink(self.path)
+        old_umask = os.umask(0o177)  # the socket can capture the screen; owner only
+        try:
+            self._server = _Server(self.path, _Handler)
+        finally:
+            os.umask(old_umask)
+        self._server.daemon = self
+        threading.Thread(target=self._keep_warm, daemon=True).start()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._stop.set()
+            self._server.server_close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def shutdown(self):
+        if self._server:
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+    def _keep_warm(self):
+        """Open a connection at start-up and keep it from idling out between questions."""
+        warm = self.core.client.with_options(max_retries=0, timeout=10)
+        while True:
+            if time.monotonic() - self._last_request >= self.keepalive or self.requests == 0:
+                try:
+                    warm.models.list()
+                except Exception:
+                    pass
+            if not self.keepalive or self._stop.wait(self.keepalive):
+                return
+
+    def _touch(self):
+        with self._lock:
+            self.requests += 1
+            self._last_request = time.monotonic()
+
+    def _store(self, table: OrderedDict, value) -> str:
+        with self._lock:
+            key = str(next(self._ids))
+            table[key] = value
+            while len(table) > MAX_WAITING:
+                table.popitem(last=False)
+            return key
+
+    def _take(self, table: OrderedDict, key: str):
+        with self._lock:
+            value = table.pop(key, None)
+        if value is None:
+            raise KeyError(f"Unknown or expired id {key!r}")
+        return value
+
+    def _settings(self, data: Optional[dict]) -> Optional[CaptureSettings]:
+        if not data:
+            return None
+        settings = self.core.capture_settings
+        region = data.get("region")
+        if isinstance(region, (list, tuple)):
+            region = ",".join(str(v) for v in region)
+        if data.get("mode") or region:
+            settings = CaptureSettings.from_env(data.get("mode"), region)
+        # The front end's own window (e.g. its terminal) is never the target
+        return replace(settings, window=data.get("window"), exclude=tuple(data.get("exclude") or ()))
+
+    # --- operations --------------------------------------------------------
+
+    def op_status(self, handler) -> dict:
+        core = self.core
+        with core._history_lock:
+            turns = sum(1 for m in core.conversation_history if m["role"] == "user")
+            version = core._session_version
+        return {
+            "ok": True,
+            "pid": os.getpid(),
+            "uptime": time.time() - self.started,
+            "session_version": version,
+            "turns": turns,
+            "requests": self.requests,
+            "capture": core.capture_settings.describe(),
+            "latency": core.latency.status() if core.latency else None,
+            "hedging": core.hedging.status() if core.hedging else None,
+        }
+
+    def op_capture(self, handler, settings: Optional[dict] = None) -> dict:
+        self._touch()
+        screenshot = self.core.capture_for_question(self._settings(settings))
+        if screenshot is None:
+            return {"ok": False, "error": "Failed to capture screen"}
+        return {"ok": True, "frame": self._store(self._frames, screenshot)}
+
+    def op_prepare(self, handler, question: str, frame: str, session_version: Optional[int] = None,
+                   has_history: Optional[bool] = None) -> dict:
+        prepared = self.core.prepare_question(
+            question, self._take(self._frames, frame), session_version=session_version, has_history=has_history
+        )
+        return {
+            "ok": True,
+            "prepared": self._store(self._prepared, prepared),
+            "session_version": prepared.session_version,
+            "route": asdict(prepared.route),
+        }
+
+    def op_send(self, handler, prepared: str) -> dict:
+        self._touch()
+        return self._send(handler, self._take(self._prepared, prepared))
+
+    def op_ask(self, handler, question: str, settings: Optional[dict] = None) -> dict:
+        """Capture, prepare and send in one request (used by the CLI client)."""
+        self._touch()
+        screenshot = self.core.capture_for_question(self._settings(settings))
+        if screenshot is None:
+            return {"ok": False, "error": "Failed to capture screen"}
+        return self._send(handler, self.core.prepare_question(question, screenshot))
+
+    def _send(self, handler, prepared) -> dict:
+        token = CancelToken()
+        handler.watch_disconnect(token)
+
+        def on_delta(text):
+            if not handler.send({"delta": text}):
+                token.cancel()
+
+        answer = self.core.send_prepared(prepared, token, on_delta)
+        if token.cancelled:
+            return {"ok": False, "cancelled": True, "error": "Request cancelled"}
+        if answer is None:
+            return {"ok": False, "error": "Failed to get response"}
+        return {"ok": True, "answer": answer, "route": asdict(prepared.route)}
+
+    def op_reset(self, handler) -> dict:
+        self.core.reset_conversation()
+        return {"ok": True, "session_version": self.core.session_version}
+
+    def op_cancel(self, handler) -> dict:
+        self.core.cancel_pending()
+        return {"ok": True}
+
+    def op_shutdown(self, handler) -> dict:
+        self.shutdown()
+        return {"ok": True}
+
+
+def main():
+    """Entry point for the daemon."""
+    if not hasattr(socket, "AF_UNIX"):
+        print("The assistant daemon needs Unix domain sockets, which this platform does not provide.")
+        sys.exit(1)
+
+    parser = argparse.ArgumentParser(description="Screen Context GPT Assistant (resident daemon)")
+    parser.add_argument("--socket", help="socket path (default: $ASSISTANT_SOCKET or the user runtime directory)")
+    parser.add_argument("--capture-mode", choices=CAPTURE_MODES, help="default part of the screen to capture")
+    parser.add_argument("--region", metavar="X,Y,W,H", help="default rectangle to capture")
+    parser.add_argument(
+        "--record", nargs="?", const="sessions", metavar="PATH",
+        help="record the session to PATH (a .zip file or a directory; default: ./sessions)"
+    )
+    args = parser.parse_args()
+
+    try:
+        # Pooled connections outlive the gaps between questions; the keep-warm
+        # thread refreshes them before the server side drops them
+        keepalive = float(os.getenv("DAEMON_KEEPALIVE", "45"))
+        core = ScreenAssistantCore(create_client(keepalive_expiry=max(keepalive * 2, 5.0)))
+        core.capture_settings = CaptureSettings.from_env(args.capture_mode, args.region)
+        if args.record:
+            path = args.record
+            if not path.endswith(".zip"):
+                path = os.path.join(path, time.strftime("session-%Y%m%d-%H%M%S.zip"))
+            core.start_recording(path)
+            print(f"Recording session to {path}")
+        daemon = AssistantDaemon(core, args.socket or default_socket_path(), keepalive)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.shutdown())
+    print(f"Assistant daemon listening on {daemon.path} (pid {os.getpid()})")
+    try:
+        daemon.serve()
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        core.close()
+    print("Assistant daemon stopped.")
+
+
+if __name__ == "__main__":
+    main()
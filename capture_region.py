@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Capture regions for the Screen Context GPT Assistant.
+Instead of the whole primary monitor, a question can be captured from the
+active window, a region around the mouse cursor, or a manually selected
+rectangle. Fewer pixels make capture, encoding and upload faster and keep
+unrelated desktop clutter out of the answer.
+
+Window and cursor lookups use libX11 through ctypes on Linux (so they work
+under Xvfb without extra packages), user32 on Windows and Quartz on macOS
+when pyobjc is installed. When a lookup is not available the capture falls
+back to the full primary monitor.
+
+By the time a question is captured the assistant itself usually has focus,
+so front ends remember the target window before they take it (see
+active_window), and lookups skip this process's own windows.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Collection, List, Optional, Tuple
+
+CAPTURE_MODES = ("screen", "window", "cursor", "region")
+
+# (left, top, width, height) in virtual screen coordinates
+Rect = Tuple[int, int, int, int]
+
+
+def parse_region(value: str) -> Rect:
+    """Parse "left,top,width,height" into a rectangle."""
+    parts = [int(p) for p in value.replace("x", ",").split(",")]
+    if len(parts) != 4 or parts[2] <= 0 or parts[3] <= 0:
+        raise ValueError(f"Invalid region {value!r}; expected left,top,width,height")
+    return tuple(parts)
+
+
+def parse_size(value: str) -> Tuple[int, int]:
+    """Parse "WIDTHxHEIGHT"."""
+    width, height = (int(p) for p in value.lower().split("x"))
+    return width, height
+
+
+# --- X11 -------------------------------------------------------------------
+
+XA_ATOM, XA_CARDINAL, XA_WINDOW = 4, 6, 33
+
+_xlib = None
+_XErrorHandler = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p)
+# Xlib's default error handler exits the process, e.g. when a remembered
+# window has been closed; report errors as failed calls instead
+_X_ERROR_HANDLER = _XErrorHandler(lambda display, event: 0)
+# The error handler is process-wide (Tk shares it), so lookups install
+# theirs one at a time and restore the previous one afterwards
+_x_error_lock = threading.Lock()
+
+
+def _load_xlib():
+    global _xlib
+    if _xlib is not None:
+        return _xlib or None
+    path = ctypes.util.find_library("X11")
+    if not path or not os.getenv("DISPLAY"):
+        _xlib = False
+        return None
+    x = ctypes.cdll.LoadLibrary(path)
+    c_ulong_p = ctypes.POINTER(ctypes.c_ulong)
+    c_int_p = ctypes.POINTER(ctypes.c_int)
+    c_uint_p = ctypes.POINTER(ctypes.c_uint)
+    x.XOpenDisplay.argtypes = [ctypes.c_char_p]
+    x.XOpenDisplay.restype = ctypes.c_void_p
+    x.XCloseDisplay.argtypes = [ctypes.c_void_p]
+    x.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+    x.XDefaultRootWindow.restype = ctypes.c_ulong
+    x.XInternAtom.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int]
+    x.XInternAtom.restype = ctypes.c_ulong
+    x.XGetWindowProperty.argtypes = [
+        ctypes.c_void_p, ctypes.c_ulong, ctypes.c_ulong, ctypes.c_long, ctypes.c_long,
+        ctypes.c_int, ctypes.c_ulong, c_ulong_p, c_int_p, c_ulong_p, c_ulong_p,
+        ctypes.POINTER(ctypes.c_void_p),
+    ]
+    x.XFree.argtypes = [ctypes.c_void_p]
+    x.XGetGeometry.argtypes = [
+        ctypes.c_void_p, ctypes.c_ulong, c_ulong_p, c_int_p, c_int_p, c_uint_p, c_uint_p, c_uint_p, c_uint_p,
+    ]
+    x.XTranslateCoordinates.argtypes = [
+        ctypes.c_void_p, ctypes.c_ulong, ctypes.c_ulong, ctypes.c_int, ctypes.c_int, c_int_p, c_int_p, c_ulong_p,
+    ]
+    x.XQueryPointer.argtypes = [
+        ctypes.c_void_p, ctypes.c_ulong, c_ulong_p, c_ulong_p, c_int_p, c_int_p, c_int_p, c_int_p, c_uint_p,
+    ]
+    x.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    x.XSetErrorHandler.argtypes = [ctypes.c_void_p]
+    x.XSetErrorHandler.restype = ctypes.c_void_p
+    _xlib = x
+    return x
+
+
+@contextmanager
+def _x11_display():
+    """
+    Open a display for one lookup, trapping X errors only for its duration.
+
+    Yields (xlib, display), or (None, None) when X11 is not available.
+    """
+    x = _load_xlib()
+    if not x:
+        yield None, None
+        return
+    with _x_error_lock:
+        previous = x.XSetErrorHandler(ctypes.cast(_X_ERROR_HANDLER, ctypes.c_void_p))
+        try:
+            display = x.XOpenDisplay(None)
+            if not display:
+                yield x, None
+                return
+            try:
+                yield x, display
+            finally:
+                # Errors arrive asynchronously; collect them before the handler goes
+                x.XSync(display, 0)
+                x.XCloseDisplay(display)
+        finally:
+            x.XSetErrorHandler(previous)
+
+
+def _x11_property(x, display, window: int, name: bytes, kind: int, limit: int = 1024) -> List[int]:
+    """Read a format-32 window property (returned by Xlib as C longs)."""
+    atom = x.XInternAtom(display, name, True)
+    if not atom:
+        return []
+    actual_type, actual_format = ctypes.c_ulong(), ctypes.c_int()
+    nitems, remaining = ctypes.c_ulong(), ctypes.c_ulong()
+    data = ctypes.c_void_p()
+    status = x.XGetWindowProperty(
+        display, window, atom, 0, limit, 0, kind, ctypes.byref(actual_type), ctypes.byref(actual_format),
+        ctypes.byref(nitems), ctypes.byref(remaining), ctypes.byref(data),
+    )
+    if status != 0 or not data.value:
+        return []
+    try:
+        if actual_format.value != 32:
+            return []
+        values = ctypes.cast(data, ctypes.POINTER(ctypes.c_ulong))
+        return [values[i] for i in range(nitems.value)]
+    finally:
+        x.XFree(data)
+
+
+def _x11_window_rect(x, display, window: int) -> Optional[Rect]:
+    root = x.XDefaultRootWindow(display)
+    geometry_root = ctypes.c_ulong()
+    gx, gy = ctypes.c_int(), ctypes.c_int()
+    width, height, border, depth = ctypes.c_uint(), ctypes.c_uint(), ctypes.c_uint(), ctypes.c_uint()
+    if not x.XGetGeometry(display, window, ctypes.byref(geometry_root), ctypes.byref(gx), ctypes.byref(gy),
+                          ctypes.byref(width), ctypes.byref(height), ctypes.byref(border), ctypes.byref(depth)):
+        return None
+    left, top, child = ctypes.c_int(), ctypes.c_int(), ctypes.c_ulong()
+    if not x.XTranslateCoordinates(display, window, root, 0, 0,
+                                   ctypes.byref(left), ctypes.byref(top), ctypes.byref(child)):
+        return None
+    return left.value, top.value, width.value, height.value
+
+
+def _x11_active_window(exclude: Collection[int]) -> Optional[int]:
+    with _x11_display() as (x, display):
+        if not display:
+            return None
+        root = x.XDefaultRootWindow(display)
+        # The focused window first, then the others from the top of the stack down
+        candidates = _x11_property(x, display, root, b"_NET_ACTIVE_WINDOW", XA_WINDOW, 1)
+        candidates += reversed(_x11_property(x, display, root, b"_NET_CLIENT_LIST_STACKING", XA_WINDOW))
+        hidden = x.XInternAtom(display, b"_NET_WM_STATE_HIDDEN", True)
+        for window in candidates:
+            if not window or window in exclude:
+                continue
+            if os.getpid() in _x11_property(x, display, window, b"_NET_WM_PID", XA_CARDINAL, 1):
+                continue
+            if hidden and hidden in _x11_property(x, display, window, b"_NET_WM_STATE", XA_ATOM):
+                continue
+            return window
+        return None
+
+
+def _x11_rect(window: int) -> Optional[Rect]:
+    with _x11_display() as (x, display):
+        if not display:
+            return None
+        return _x11_window_rect(x, display, window)
+
+
+def _x11_cursor() -> Optional[Tuple[int, int]]:
+    with _x11_display() as (x, display):
+        if not display:
+            return None
+        root = x.XDefaultRootWindow(display)
+        root_ret, child = ctypes.c_ulong(), ctypes.c_ulong()
+        rx, ry, wx, wy = ctypes.c_int(), ctypes.c_int(), ctypes.c_int(), ctypes.c_int()
+        mask = ctypes.c_uint()
+        if not x.XQueryPointer(display, root, ctypes.byref(root_ret), ctypes.byref(child), ctypes.byref(rx),
+                               ctypes.byref(ry), ctypes.byref(wx), ctypes.byref(wy), ctypes.byref(mask)):
+            return None
+        return rx.value, ry.value
+
+
+# --- Windows ---------------------------------------------------------------
+
+def _win32_active_window(exclude: Collection[int]) -> Optional[int]:
+    from ctypes import wintypes
+
+    user32 = ctypes.windll.user32
+    user32.GetForegroundWindow.restype = wintypes.HWND
+    user32.GetWindow.restype = wintypes.HWND
+    user32.GetWindow.argtypes = [wintypes.HWND, wintypes.UINT]
+    GW_HWNDNEXT = 2
+    hwnd = user32.GetForegroundWindow()
+    # The foreground window first, then the others from the top of the z-order down
+    for _ in range(1000):
+        if not hwnd:
+            return None
+        pid = wintypes.DWORD()
+        user32.GetWindowThreadProcessId(hwnd, ctypes.byref(pid))
+        if (hwnd not in exclude and pid.value != os.getpid() and user32.IsWindowVisible(hwnd)
+                and not user32.IsIconic(hwnd) and user32.GetWindowTextLengthW(hwnd) > 0):
+            return hwnd
+        hwnd = user32.GetWindow(hwnd, GW_HWNDNEXT)
+    return None
+
+
+def _win32_rect(hwnd: int) -> Optional[Rect]:
+    from ctypes import wintypes
+
+    user32 = ctypes.windll.user32
+    rect = wintypes.RECT()
+    if not user32.IsWindow(hwnd) or not user32.GetWindowRect(hwnd, ctypes.byref(rect)):
+        return None
+    return rect.left, rect.top, rect.right - rect.left, rect.bottom - rect.top
+
+
+def _win32_cursor() -> Optional[Tuple[int, int]]:
+    from ctypes import wintypes
+
+    point = wintypes.POINT()
+    if not ctypes.windll.user32.GetCursorPos(ctypes.byref(point)):
+        return None
+    return point.x, point.y
+
+
+# --- macOS -----------------------------------------------------------------
+
+def _quartz_bounds(info) -> Rect:
+    bounds = info["kCGWindowBounds"]
+    return int(bounds["X"]), int(bounds["Y"]), int(bounds["Width"]), int(bounds["Height"])
+
+
+def _quartz_active_window(exclude: Collection[int]) -> Optional[int]:
+    try:
+        import Quartz
+    except ImportError:
+        return None
+    # Front to back; layer 0 holds normal application windows
+    windows = Quartz.CGWindowListCopyWindowInfo(
+        Quartz.kCGWindowListOptionOnScreenOnly | Quartz.kCGWindowListExcludeDesktopElements,
+        Quartz.kCGNullWindowID,
+    )
+    for info in windows or []:
+        if (info.get("kCGWindowLayer") == 0 and info.get("kCGWindowOwnerPID") != os.getpid()
+                and info.get("kCGWindowNumber") not in exclude):
+            return int(info["kCGWindowNumber"])
+    return None
+
+
+def _quartz_rect(window: int) -> Optional[Rect]:
+    try:
+        import Quartz
+    except ImportError:
+        return None
+    windows = Quartz.CGWindowListCopyWindowInfo(Quartz.kCGWindowListOptionIncludingWindow, window)
+    for info in windows or []:
+        if info.get("kCGWindowNumber") == window:
+            return _quartz_bounds(info)
+    return None
+
+
+def _quartz_cursor() -> Optional[Tuple[int, int]]:
+    try:
+        import Quartz
+    except ImportError:
+        return None
+    location = Quartz.CGEventGetLocation(Quartz.CGEventCreate(None))
+    return int(location.x), int(location.y)
+
+
+def active_window(exclude: Collection[int] = ()) -> Optional[int]:
+    """
+    Id of the window a question is most likely about, or None if unknown.
+
+    That is the focused window unless it belongs to this process or is in
+    `exclude` (e.g. the terminal the CLI runs in); then the next window down
+    the stacking order that is not minimized.
+    """
+    try:
+        if sys.platform == "win32":
+            return _win32_active_window(exclude)
+        if sys.platform == "darwin":
+            return _quartz_active_window(exclude)
+        return _x11_active_window(exclude)
+    except Exception as e:
+        print(f"Could not locate active window: {e}")
+        return None
+
+
+def window_rect(window: int) -> Optional[Rect]:
+    """Rectangle of a window by id, or None if it no longer exists."""
+    try:
+        if sys.platform == "win32":
+            return _win32_rect(window)
+        if sys.platform == "darwin":
+            return _quartz_rect(window)
+        return _x11_rect(window)
+    except Exception as e:
+        print(f"Could not locate window: {e}")
+        return None
+
+
+def terminal_window() -> Optional[int]:
+    """The window of the terminal a command-line front end runs in, if known."""
+    window = os.getenv("WINDOWID")
+    if window and window.isdigit():
+        return int(window)
+    # At start-up the terminal the command was typed into has focus
+    return active_window()
+
+
+def active_window_rect(exclude: Collection[int] = ()) -> Optional[Rect]:
+    """Rectangle of active_window(exclude), or None if it cannot be determined."""
+    window = active_window(exclude)
+    return window_rect(window) if window else None
+
+
+def cursor_position() -> Optional[Tuple[int, int]]:
+    """Mouse cursor position, or None if it cannot be determined."""
+    try:
+        if sys.platform == "win32":
+            return _win32_cursor()
+        if sys.platform == "darwin":
+            return _quartz_cursor()
+        return _x11_cursor()
+    except Exception as e:
+        print(f"Could not locate cursor: {e}")
+        return None
+
+
+def _clamp(rect: Rect, bounds: dict) -> Optional[dict]:
+    left = max(rect[0], bounds["left"])
+    top = max(rect[1], bounds["top"])
+    right = min(rect[0] + rect[2], bounds["left"] + bounds["width"])
+    bottom = min(rect[1] + rect[3], bounds["top"] + bounds["height"])
+    if right - left < 16 or bottom - top < 16:
+        return None
+    return {"left": left, "top": top, "width": right - left, "height": bottom - top}
+
+
+@dataclass
+class CaptureSettings:
+    """Which part of the screen to capture for a question."""
+    mode: str = "screen"
+    region: Optional[Rect] = None
+    cursor_size: Tuple[int, int] = (1280, 800)
+    # Window mode: the window to capture, remembered before the assistant took
+    # focus, and windows never to pick when looking it up at capture time
+    window: Optional[int] = None
+    exclude: Tuple[int, ...] = ()
+
+    @classmethod
+    def from_env(cls, mode: Optional[str] = None, region: Optional[str] = None) -> "CaptureSettings":
+        """
+        Build settings from CAPTURE_MODE, CAPTURE_REGION and CAPTURE_CURSOR_SIZE.
+
+        Explicit arguments (e.g. from command-line flags) take precedence.
+        """
+        region = region or os.getenv("CAPTURE_REGION")
+        mode = mode or os.getenv("CAPTURE_MODE") or ("region" if region else "screen")
+        if mode not in CAPTURE_MODES:
+            raise ValueError(f"Unknown capture mode {mode!r}; expected one of {', '.join(CAPTURE_MODES)}")
+        return cls(
+            mode=mode,
+            region=parse_region(region) if region else None,
+            cursor_size=parse_size(os.getenv("CAPTURE_CURSOR_SIZE", "1280x800")),
+        )
+
+    def describe(self) -> str:
+        if self.mode == "region" and self.region:
+            return "region {}x{} at {},{}".format(self.region[2], self.region[3], self.region[0], self.region[1])
+        return {"screen": "full screen", "window": "active window", "cursor": "around cursor"}.get(self.mode, self.mode)
+
+    def resolve(self, monitors: List[dict]) -> dict:
+        """
+        Turn the settings into an mss grab rectangle.
+
+        Args:
+            monitors: mss monitor list (0 is the virtual screen, 1 the primary monitor)
+        """
+        primary, everything = monitors[1], monitors[0]
+        rect = None
+        if self.mode == "window":
+            rect = window_rect(self.window) if self.window else None
+            if rect is None:
+                rect = active_window_rect(self.exclude)
+        elif self.mode == "cursor":
+            position = cursor_position()
+            if position:
+                # Centre on the cursor, shifted to stay on screen near the edges
+                width = min(self.cursor_size[0], everything["width"])
+                height = min(self.cursor_size[1], everything["height"])
+                left = min(max(position[0] - width // 2, everything["left"]),
+                           everything["left"] + everything["width"] - width)
+                top = min(max(position[1] - height // 2, everything["top"]),
+                          everything["top"] + everything["height"] - height)
+                rect = (left, top, width, height)
+        elif self.mode == "region":
+            rect = self.region
+        if rect is None:
+            return primary
+        return _clamp(rect, everything) or primary
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Off-process screen capture and encoding for the Screen Context GPT Assistant.
+A worker process owns the capture engine and the JPEG/base64 encoder so that
+neither competes with the Tk mainloop for the GIL. Encoded frames are handed
+back through multiprocessing.shared_memory; only a small handle is pickled.
+"""
+
+import atexit
+import base64
+import io
+import multiprocessing
+import threading
+import time
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+from PIL import Image
+
+from frame_buffer import frame_difference, frame_signature
+from capture_region import CaptureSettings
+from latency_controller import OperatingPoint, scale_to
+
+# Initial size of the worker's shared memory block; it grows on demand
+INITIAL_BUFFER_BYTES = 4 * 1024 * 1024
+
+
+@dataclass
+class EncodedFrame:
+    """A screenshot that has already been captured and encoded elsewhere."""
+    base64: str
+    size: Tuple[int, int]
+    signature: bytes
+    encode_time: float = 0.0  # seconds the worker spent encoding it
+    point: Optional[OperatingPoint] = None  # latency operating point it was encoded at
+
+
+def _encode(image: Image.Image, quality: int, max_side: Optional[int] = None) -> bytes:
+    buffered = io.BytesIO()
+    image = scale_to(image, max_side)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image.save(buffered, format="JPEG", quality=quality)
+    return base64.b64encode(buffered.getvalue())
+
+
+def _worker_main(conn):
+    """Worker process loop: capture, encode and publish frames on request."""
+    import mss
+
+    sct = mss.mss()
+    shm = None
+    try:
+        while True:
+            try:
+                op, options = conn.recv()
+            except EOFError:
+                break
+            if op == "stop":
+                break
+            try:
+                settings = options.get("settings") or CaptureSettings()
+                monitor = settings.resolve(sct.monitors)
+                screenshot = sct.grab(monitor)
+                image = Image.frombytes("RGB", screenshot.size, screenshot.bgra, "raw", "BGRX")
+                signature = frame_signature(image)
+                unchanged_from = options.get("unchanged_from")
+                if unchanged_from and frame_difference(signature, unchanged_from) < options.get("threshold", 0.0):
+                    conn.send(("unchanged", image.size, signature))
+                    continue
+                started = time.perf_counter()
+                payload = _encode(image, options.get("quality", 85), options.get("max_side"))
+                encode_time = time.perf_counter() - started
+
+                if shm is None or shm.size < len(payload):
+                    old = shm
+                    shm = shared_memory.SharedMemory(
+                        create=True, size=max(INITIAL_BUFFER_BYTES, len(payload) * 2)
+                    )
+                    if old is not None:
+                        old.close()
+                        old.unlink()
+                shm.buf[:len(payload)] = payload
+                conn.send(("ok", shm.name, len(payload), image.size, signature, encode_time))
+            except Exception as e:
+                conn.send(("error", str(e)))
+    finally:
+        sct.close()
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+
+class CaptureWorker:
+    """Client side of the capture worker process."""
+
+    def __init__(self, timeout: float = 10.0):
+        self.timeout = timeout
+        self._ctx = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._conn = None
+        self._process = None
+        self._shm = None
+        atexit.register(self.stop)
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def start(self):
+        """Start the worker process if it is not running."""
+        with self._lock:
+            self._start()
+
+    def _start(self):
+        if self.alive:
+            return
+        if self._process is not None:
+            self._process.join(timeout=2)  # exited on its own; reap it
+        if self._conn is not None:
+            self._conn.close()
+        self._conn, child_conn = self._ctx.Pipe()
+        self._process = self._ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self._process.start()
+        child_conn.close()
+
+    def stop(self):
+        """Stop the worker process; it releases its shared memory on the way out."""
+        with self._lock:
+            self._release()
+            if self.alive:
+                try:
+                    self._conn.send(("stop", {}))
+                except (BrokenPipeError, OSError):
+                    pass
+                self._process.join(timeout=2)
+                if self._process.is_alive():
+                    self._process.terminate()
+            self._process = None
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _release(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm = None
+
+    def _attach(self, name: str) -> shared_memory.SharedMemory:
+        """Map the worker's buffer, reusing the mapping while the name is unchanged."""
+        if self._shm is not None and self._shm.name == name:
+            return self._shm
+        self._release()
+        # The spawned worker shares this process's resource tracker, so attaching
+        # here does not add a second owner; the worker unlinks the block
+        self._shm = shared_memory.SharedMemory(name=name)
+        return self._shm
+
+    def capture(self, settings: Optional[CaptureSettings] = None, quality: int = 85,
+                max_side: Optional[int] = None, unchanged_from: Optional[bytes] = None,
+                threshold: float = 0.0) -> Optional[EncodedFrame]:
+        """
+        Capture and encode the screen in the worker process.
+        
+        Args:
+            settings: Capture area (defaults to the primary monitor)
+            quality: JPEG quality
+            max_side: Downscale so the longest side is at most this many pixels
+            unchanged_from: Signature of a previous frame; a screen that differs
+                from it by less than threshold is not encoded
+            threshold: Minimum frame_difference from unchanged_from worth encoding
+
+        Returns:
+            EncodedFrame with the base64 JPEG payload (empty if the screen was
+            unchanged), or None if capture fails
+        """
+        with self._lock:
+            try:
+                self._start()
+                self._conn.send(("capture", {"settings": settings, "quality": quality, "max_side": max_side,
+                                             "unchanged_from": unchanged_from, "threshold": threshold}))
+                if not self._conn.poll(self.timeout):
+                    raise TimeoutError("capture worker did not respond")
+                reply = self._conn.recv()
+                if reply[0] == "unchanged":
+                    return EncodedFrame("", tuple(reply[1]), reply[2])
+                if reply[0] != "ok":
+                    print(f"Error capturing screen: {reply[1]}")
+                    return None
+                _, name, nbytes, size, signature, encode_time = reply
+                # Copy out before releasing the lock; the worker reuses the buffer
+                payload = bytes(self._attach(name).buf[:nbytes]).decode("ascii")
+                return EncodedFrame(payload, tuple(size), signature, encode_time)
+            except (EOFError, OSError, TimeoutError) as e:
+                print(f"Capture worker failed, restarting: {e}")
+                if self._process is not None:
+                    self._process.terminate()
+                    self._process.join(timeout=2)
+                self._process = None
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+                self._release()
+                return None
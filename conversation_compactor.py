@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Conversation compaction for the Screen Context GPT Assistant.
+Older turns are folded into a short summary note by a cheap model call that
+runs in the background between questions, so the prompt stays roughly the
+same size no matter how long the session runs.
+"""
+
+import os
+import threading
+from contextlib import nullcontext
+from typing import Callable, ContextManager, List, Optional
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:"
+
+SUMMARY_INSTRUCTIONS = (
+    "You compress a conversation between a user and a screen-aware assistant. "
+    "Write a short summary (at most 8 bullet points) of what the user is doing, "
+    "what was already answered, and any steps, names or values the assistant may "
+    "need later. Do not add advice."
+)
+
+# Rough token costs used for budgeting; images follow the vision pricing tiers
+TEXT_CHARS_PER_TOKEN = 4
+IMAGE_TOKENS = {"low": 85, "high": 765}
+
+
+def estimate_tokens(messages: List[dict]) -> int:
+    """Cheap local estimate of the prompt tokens for a list of messages."""
+    total = 0
+    for message in messages:
+        total += 4
+        content = message.get("content")
+        if isinstance(content, str):
+            total += len(content) // TEXT_CHARS_PER_TOKEN
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                total += len(part["text"]) // TEXT_CHARS_PER_TOKEN
+            elif part.get("type") == "image_url":
+                detail = part["image_url"].get("detail", "high")
+                total += IMAGE_TOKENS.get(detail, IMAGE_TOKENS["high"])
+            elif part.get("type") == "input_image":
+                # Uploaded screenshot referenced by file id
+                total += IMAGE_TOKENS.get(part.get("detail", "high"), IMAGE_TOKENS["high"])
+    return total
+
+
+def is_summary(message: dict) -> bool:
+    """Whether a message is a summary note produced by compaction."""
+    content = message.get("content")
+    return (
+        message.get("role") == "system"
+        and isinstance(content, str)
+        and content.startswith(SUMMARY_PREFIX)
+    )
+
+
+OMITTED_IMAGE_TEXT = "[earlier screenshot omitted]"
+
+
+def has_image(message: dict) -> bool:
+    content = message.get("content")
+    return isinstance(content, list) and any(part.get("type") != "text" for part in content)
+
+
+def prune_images(history: List[dict], keep: int) -> int:
+    """
+    Drop screenshots from all but the newest `keep` messages that carry them.
+
+    Pruned messages are replaced by new dicts (never mutated in place) so that
+    snapshots of the history taken by other threads stay intact.
+
+    Returns:
+        Number of messages pruned
+    """
+    pruned = 0
+    seen = 0
+    for index in range(len(history) - 1, -1, -1):
+        message = history[index]
+        if not has_image(message):
+            continue
+        seen += 1
+        if seen <= keep:
+            continue
+        text = [part for part in message["content"] if part.get("type") == "text"]
+        text.append({"type": "text", "text": OMITTED_IMAGE_TEXT})
+        history[index] = {**message, "content": text}
+        pruned += 1
+    return pruned
+
+
+def _text(message: dict):
+    """Text of a message without screenshots or the marker left by pruning them."""
+    content = message.get("content")
+    if isinstance(content, str):
+        return content
+    return [
+        part["text"] for part in content or []
+        if part.get("type") == "text" and part["text"] != OMITTED_IMAGE_TEXT
+    ]
+
+
+def same_message(message: dict, original: dict) -> bool:
+    """Whether message is original, possibly with its screenshots pruned since."""
+    return message is original or (
+        message.get("role") == original.get("role") and _text(message) == _text(original)
+    )
+
+
+def transcript(messages: List[dict]) -> str:
+    """Render messages as plain text, with images replaced by a marker."""
+    lines = []
+    for message in messages:
+        content = message.get("content")
+        if is_summary(message):
+            lines.append(content)
+            continue
+        if isinstance(content, str):
+            text = content
+        else:
+            pieces = []
+            for part in content or []:
+                if part.get("type") == "text":
+                    pieces.append(part["text"])
+                else:
+                    pieces.append("[screenshot]")
+            text = " ".join(pieces)
+        lines.append(f"{message.get('role', 'user').capitalize()}: {text}")
+    return "\n".join(lines)
+
+
+class ConversationCompactor:
+    """Summarizes old turns of a conversation history in a background thread."""
+
+    def __init__(
+        self,
+        client,
+        model: str = "gpt-4o-mini",
+        max_turns: int = 6,
+        max_tokens: int = 8000,
+        keep_turns: int = 2,
+    ):
+        self.client = client
+        self.model = model
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self._thread = None
+        self.compactions = 0
+        # Optional callable returning a context manager held around each summary
+        # request, e.g. a server's admission slot
+        self.slot: Optional[Callable[[], ContextManager]] = None
+
+    @classmethod
+    def from_env(cls, client) -> Optional["ConversationCompactor"]:
+        """Create a compactor from environment settings; None if disabled."""
+        max_turns = int(os.getenv("HISTORY_COMPACT_TURNS", "6"))
+        if max_turns <= 0:
+            return None
+        return cls(
+            client,
+            model=os.getenv("SUMMARY_MODEL", "gpt-4o-mini"),
+            max_turns=max_turns,
+            max_tokens=int(os.getenv("HISTORY_COMPACT_TOKENS", "8000")),
+            keep_turns=int(os.getenv("HISTORY_KEEP_TURNS", "2")),
+        )
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _compactable(self, history: List[dict]) -> List[dict]:
+        """
+        Return the slice of history (after the system prompt) to fold into a summary.
+
+        The slice always ends on an assistant message and leaves the most recent
+        keep_turns question/answer pairs verbatim. Empty if under budget.
+        """
+        turns = [m for m in history[1:] if m.get("role") == "user"]
+        if len(turns) <= self.max_turns and estimate_tokens(history) <= self.max_tokens:
+            return []
+        end = len(history)
+        kept = 0
+        while end > 1 and kept < self.keep_turns:
+            end -= 1
+            if history[end].get("role") == "user":
+                kept += 1
+        # end now points at the oldest kept user message
+        prefix = history[1:end]
+        while prefix and prefix[-1].get("role") != "assistant":
+            prefix.pop()
+        return prefix
+
+    def maybe_compact(self, get_history, lock: threading.Lock):
+        """
+        Start a background compaction if the history is over budget.
+
+        Args:
+            get_history: Callable returning the live history list
+            lock: Lock guarding mutations of the history list
+        """
+        if self.running:
+            return
+        with lock:
+            history = get_history()
+            prefix = self._compactable(history)
+        if not prefix:
+            return
+        self._thread = threading.Thread(
+            target=self._compact, args=(get_history, lock, history, prefix), daemon=True
+        )
+        self._thread.start()
+
+    def _compact(self, get_history, lock, history, prefix):
+        try:
+            with self.slot() if self.slot else nullcontext():
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                        {"role": "user", "content": transcript(prefix)},
+                    ],
+                    max_tokens=300,
+                    temperature=0.2,
+                )
+            summary = response.choices[0].message.content
+        except Exception as e:
+            print(f"Conversation compaction failed: {e}")
+            return
+        if not summary:
+            return
+
+        with lock:
+            # Only splice if the session was not reset and the prefix is untouched;
+            # screenshots pruned by a turn that finished meanwhile do not count
+            live = get_history()
+            if live is not history or len(live) < len(prefix) + 1:
+                return
+            if not all(same_message(a, b) for a, b in zip(live[1:len(prefix) + 1], prefix)):
+                return
+            live[1:len(prefix) + 1] = [{
+                "role": "system",
+                "content": f"{SUMMARY_PREFIX}\n{summary.strip()}"
+            }]
+            self.compactions += 1
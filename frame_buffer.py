@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Watch mode for the Screen Context GPT Assistant.
+Samples the screen at a low rate, keeps changed frames as compressed keyframes
+in a memory-bounded ring buffer, and picks the most relevant ones to attach
+to a question.
+"""
+
+import base64
+import io
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from PIL import Image
+
+from latency_controller import scaled_size
+
+# Size of the grayscale thumbnail used for change detection
+SIGNATURE_SIZE = (32, 18)
+
+
+def frame_signature(image: Image.Image) -> bytes:
+    """Return a tiny grayscale thumbnail of the image used for change detection."""
+    return image.convert("L").resize(SIGNATURE_SIZE, Image.BILINEAR).tobytes()
+
+
+def frame_difference(a: Optional[bytes], b: Optional[bytes]) -> float:
+    """
+    Compare two frame signatures.
+
+    Returns:
+        Mean absolute pixel difference between 0.0 (identical) and 1.0
+    """
+    if not a or not b or len(a) != len(b):
+        return 1.0
+    return sum(abs(x - y) for x, y in zip(a, b)) / (255.0 * len(a))
+
+
+@dataclass
+class Keyframe:
+    """A compressed screen sample that differed from the previous keyframe."""
+    timestamp: float
+    jpeg: bytes
+    size: tuple
+    signature: bytes
+    change: float
+
+    def to_base64(self) -> str:
+        return base64.b64encode(self.jpeg).decode()
+
+
+class FrameRingBuffer:
+    """Fixed-size ring buffer of keyframes with a hard cap on stored bytes."""
+
+    def __init__(self, max_bytes: int, max_frames: int = 64):
+        self.max_bytes = max_bytes
+        self.max_frames = max_frames
+        self._frames = deque()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def add(self, frame: Keyframe):
+        """Add a keyframe, evicting the oldest ones to stay within the caps."""
+        if len(frame.jpeg) > self.max_bytes:
+            return
+        with self._lock:
+            self._frames.append(frame)
+            self._bytes += len(frame.jpeg)
+            while self._bytes > self.max_bytes or len(self._frames) > self.max_frames:
+                evicted = self._frames.popleft()
+                self._bytes -= len(evicted.jpeg)
+
+    def snapshot(self) -> List[Keyframe]:
+        """Return the buffered keyframes, oldest first."""
+        with self._lock:
+            return list(self._frames)
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._bytes = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+
+class ScreenWatcher:
+    """
+    Background sampler that feeds changed frames into a FrameRingBuffer.
+
+    capture returns a PIL image, or a frame that is already encoded at the
+    keyframe size and quality (a capture_worker.EncodedFrame, with an empty
+    payload when the worker found the screen unchanged since last_signature).
+    """
+
+    def __init__(
+        self,
+        capture: Callable[[], Optional[Image.Image]],
+        interval: float = 2.0,
+        max_bytes: int = 16 * 1024 * 1024,
+        change_threshold: float = 0.02,
+        keyframe_max_side: int = 1280,
+        keyframe_quality: int = 60,
+        should_sample: Optional[Callable[[], bool]] = None,
+    ):
+        self.capture = capture
+        self.interval = interval
+        self.change_threshold = change_threshold
+        self.keyframe_max_side = keyframe_max_side
+        self.keyframe_quality = keyframe_quality
+        self.should_sample = should_sample
+        self.buffer = FrameRingBuffer(max_bytes)
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_signature = None
+        self._started_at = None
+        self._cpu_seconds = 0.0
+        self.samples = 0
+        self.keyframes = 0
+
+    def start(self):
+        """Start sampling in a daemon thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling; buffered keyframes are kept."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self.should_sample and not self.should_sample():
+                continue
+            cpu_start = time.thread_time()
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Watch mode sample failed: {e}")
+            self._cpu_seconds += time.thread_time() - cpu_start
+
+    @property
+    def last_signature(self) -> Optional[bytes]:
+        """frame_signature of the most recent keyframe."""
+        return self._last_signature
+
+    def sample(self):
+        """Capture one frame and store it if it differs from the last keyframe."""
+        image = self.capture()
+        if image is None:
+            return
+        self.samples += 1
+        encoded = not isinstance(image, Image.Image)
+        signature = image.signature if encoded else frame_signature(image)
+        change = frame_difference(signature, self._last_signature)
+        if change < self.change_threshold:
+            return
+
+        if encoded:
+            # Already a keyframe-sized JPEG, e.g. from the capture worker
+            if not image.base64:
+                return
+            jpeg = base64.b64decode(image.base64)
+            size = scaled_size(image.size, self.keyframe_max_side)
+        else:
+            if max(image.size) > self.keyframe_max_side:
+                image = image.copy()
+                image.thumbnail((self.keyframe_max_side, self.keyframe_max_side))
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            buffered = io.BytesIO()
+            image.save(buffered, format="JPEG", quality=self.keyframe_quality)
+            jpeg, size = buffered.getvalue(), image.size
+
+        self.buffer.add(Keyframe(time.time(), jpeg, size, signature, change))
+        self._last_signature = signature
+        self.keyframes += 1
+
+    def relevant_frames(
+        self,
+        current: Optional[Image.Image] = None,
+        count: int = 3,
+        lookback: float = 120.0,
+        current_signature: Optional[bytes] = None,
+    ) -> List[Keyframe]:
+        """
+        Pick the recent keyframes most worth attaching to a question.
+
+        Frames older than the lookback window or nearly identical to the current
+        screen are skipped; of the rest, the ones with the largest change are
+        kept and returned oldest first.
+
+        Args:
+            current: Screenshot taken for the question, if any
+            count: Maximum number of keyframes to return
+            lookback: How far back to look, in seconds
+            current_signature: frame_signature of the current screen, if already known
+        """
+        if count <= 0:
+            return []
+        cutoff = time.time() - lookback
+        if current_signature is None and current is not None:
+            current_signature = frame_signature(current)
+        candidates = [
+            frame for frame in self.buffer.snapshot()
+            if frame.timestamp >= cutoff
+            and frame_difference(frame.signature, current_signature) >= self.change_threshold
+        ]
+        candidates.sort(key=lambda frame: frame.change, reverse=True)
+        return sorted(candidates[:count], key=lambda frame: frame.timestamp)
+
+    def stats(self) -> Dict[str, float]:
+        """Return overhead counters for the watcher."""
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        return {
+            "samples": self.samples,
+            "keyframes": self.keyframes,
+            "buffered_frames": len(self.buffer),
+            "buffered_bytes": self.buffer.nbytes,
+            "max_bytes": self.buffer.max_bytes,
+            "cpu_seconds": self._cpu_seconds,
+            "cpu_percent": 100.0 * self._cpu_seconds / elapsed if elapsed else 0.0,
+        }
+
+    def summary(self) -> str:
+        """Human-readable overhead summary."""
+        s = self.stats()
+        return (
+            f"watch: {s['samples']} samples, {s['buffered_frames']} keyframes buffered "
+            f"({s['buffered_bytes'] / 1024 / 1024:.1f}/{s['max_bytes'] / 1024 / 1024:.0f} MB), "
+            f"CPU {s['cpu_percent']:.2f}%"
+        )
+
+
+def watcher_from_env(
+    capture: Callable[[], Optional[Image.Image]],
+    should_sample: Optional[Callable[[], bool]] = None,
+) -> Optional[ScreenWatcher]:
+    """Create a ScreenWatcher if WATCH_MODE is enabled in the environment."""
+    if os.getenv("WATCH_MODE", "false").lower() != "true":
+        return None
+    return ScreenWatcher(
+        capture,
+        interval=float(os.getenv("WATCH_INTERVAL", "2.0")),
+        max_bytes=int(float(os.getenv("WATCH_MAX_MB", "16")) * 1024 * 1024),
+        change_threshold=float(os.getenv("WATCH_CHANGE_THRESHOLD", "0.02")),
+        should_sample=should_sample,
+    )
+
+
+def keyframe_content(keyframes: List[Keyframe]) -> List[dict]:
+    """Build message content parts for keyframes, oldest first."""
+    if not keyframes:
+        return []
+    now = time.time()
+    ages = ", ".join(f"{int(now - frame.timestamp)}s ago" for frame in keyframes)
+    parts = [{
+        "type": "text",
+        "text": f"Earlier screenshots from watch mode ({ages}), followed by the current screen:"
+    }]
+    for frame in keyframes:
+        parts.append({
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:image/jpeg;base64,{frame.to_base64()}",
+                "detail": "low"
+            }
+        })
+    return parts
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Background screenshot upload for the Screen Context GPT Assistant.
+With pre-upload on, a screenshot is encoded and sent to the files endpoint
+as soon as it is captured (while the question is still being typed), and
+the request references the uploaded file instead of carrying the image
+inline, so the request sent after Enter stays small. Chat completions only
+take images inline, so such requests go through the Responses API, which
+accepts an `input_image` part with a file id.
+
+Each uploaded file is used by one request and deleted when it ends; the
+conversation history keeps the screenshot inline, so later questions do
+not depend on the file.
+"""
+
+import base64
+import io
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterable, Optional, Set, Tuple
+
+from capture_worker import EncodedFrame
+from frame_buffer import frame_signature
+from latency_controller import OperatingPoint, scale_to
+
+
+@dataclass
+class PreUploadedImage:
+    """A screenshot whose upload was started before the question was asked."""
+    signature: bytes
+    size: Tuple[int, int]
+    future: Future = field(repr=False)  # resolves to (base64 JPEG, file id or None)
+    uploader: "ImageUploader" = field(repr=False)
+    used: bool = False
+    point: Optional[OperatingPoint] = None  # latency operating point it was encoded at
+
+    def result(self, timeout: Optional[float] = None) -> Tuple[str, Optional[str]]:
+        """Wait for the upload; returns the encoded image and its file id (None if the upload failed)."""
+        return self.future.result(timeout)
+
+    def discard(self):
+        """Delete the uploaded file if the screenshot was never used in a question."""
+        if not self.used:
+            self.future.add_done_callback(
+                lambda f: f.exception() is None and self.uploader.delete(f.result()[1])
+            )
+
+
+def file_part(file_id: str, detail: str) -> dict:
+    """Responses API content part referencing an uploaded screenshot."""
+    return {"type": "input_image", "file_id": file_id, "detail": detail}
+
+
+def referenced_files(messages: Iterable[dict]) -> Set[str]:
+    """File ids referenced by uploaded-image content parts in the messages."""
+    ids = set()
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            for part in content:
+                if part.get("type") == "input_image" and part.get("file_id"):
+                    ids.add(part["file_id"])
+    return ids
+
+
+def file_rejected(error, file_ids: Iterable[str]) -> bool:
+    """Whether a 400 error is about the referenced files rather than the rest of the request."""
+    message = str(getattr(error, "message", None) or error)
+    param = getattr(error, "param", None) or ""
+    return "file" in param or any(file_id in message for file_id in file_ids)
+
+
+class ImageUploader:
+    """Encodes and uploads screenshots on a background thread."""
+
+    def __init__(self, client, purpose: str = "vision", timeout: float = 30.0):
+        self.client = client.with_options(timeout=timeout, max_retries=1)
+        self.purpose = purpose
+        self.enabled = True
+        self.uploads = 0
+        self.failures = 0
+        self._files: Set[str] = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-upload")
+
+    @classmethod
+    def from_env(cls, client) -> Optional["ImageUploader"]:
+        """Create an uploader if PREUPLOAD=true (purpose from PREUPLOAD_PURPOSE)."""
+        if os.getenv("PREUPLOAD", "false").lower() != "true":
+            return None
+        return cls(client, purpose=os.getenv("PREUPLOAD_PURPOSE", "vision"))
+
+    def start(self, screenshot, quality: int = 85, max_side: Optional[int] = None) -> PreUploadedImage:
+        """Begin encoding and uploading a screenshot (PIL image or EncodedFrame)."""
+        if isinstance(screenshot, EncodedFrame):
+            signature, size = screenshot.signature, screenshot.size
+        else:
+            signature, size = frame_signature(screenshot), screenshot.size
+        future = self._executor.submit(self._upload, screenshot, quality, max_side)
+        return PreUploadedImage(signature, size, future, self)
+
+    def _upload(self, screenshot, quality: int, max_side: Optional[int]) -> Tuple[str, Optional[str]]:
+        if isinstance(screenshot, EncodedFrame):
+            data = base64.b64decode(screenshot.base64)
+            encoded = screenshot.base64
+        else:
+            buffered = io.BytesIO()
+            image = scale_to(screenshot, max_side)
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            image.save(buffered, format="JPEG", quality=quality)
+            data = buffered.getvalue()
+            encoded = base64.b64encode(data).decode()
+        if not self.enabled:
+            return encoded, None
+        try:
+            uploaded = self.client.files.create(file=("screen.jpg", data, "image/jpeg"), purpose=self.purpose)
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+            print(f"Screenshot upload failed, sending it inline: {e}")
+            return encoded, None
+        with self._lock:
+            self.uploads += 1
+            self._files.add(uploaded.id)
+        return encoded, uploaded.id
+
+    def delete(self, file_id: Optional[str]):
+        """Delete an uploaded file in the background."""
+        if not file_id:
+            return
+        with self._lock:
+            if file_id not in self._files:
+                return
+            self._files.discard(file_id)
+        try:
+            self._executor.submit(self._delete, file_id)
+        except RuntimeError:
+            pass  # closing; close() deletes what is left
+
+    def _delete(self, file_id: str):
+        try:
+            self.client.files.delete(file_id)
+        except Exception as e:
+            print(f"Could not delete uploaded screenshot {file_id}: {e}")
+
+    def close(self):
+        """Delete every file this uploader created and stop its thread."""
+        with self._lock:
+            files = list(self._files)
+            self._files.clear()
+        for file_id in files:
+            self._executor.submit(self._delete, file_id)
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Latency target controller for the Screen Context GPT Assistant.
+Measures how long each question takes to start answering (encoding, upload
+and time to first token) and moves the screenshot's resolution, JPEG
+quality and detail level along a ladder of operating points so the next
+questions meet a configured target. Floors on resolution and quality keep
+text legible however slow the link is.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from PIL import Image
+
+
+@dataclass(frozen=True)
+class OperatingPoint:
+    """How the screenshot is encoded and sent."""
+    max_side: Optional[int]  # longest side in pixels; None keeps the capture size
+    quality: int
+    detail: str  # highest detail level the request may use
+
+    def describe(self) -> str:
+        size = f"{self.max_side}px" if self.max_side else "full size"
+        return f"{size}, q{self.quality}, {self.detail} detail"
+
+
+# From best to cheapest
+LADDER = [
+    OperatingPoint(None, 85, "high"),
+    OperatingPoint(2048, 80, "high"),
+    OperatingPoint(1600, 75, "high"),
+    OperatingPoint(1280, 70, "high"),
+    OperatingPoint(1024, 65, "high"),
+    OperatingPoint(1024, 60, "high"),
+    OperatingPoint(768, 60, "low"),
+]
+
+
+def scaled_size(size: Tuple[int, int], max_side: Optional[int]) -> Tuple[int, int]:
+    """Size an image of the given size has after scale_to(image, max_side)."""
+    if not max_side or max(size) <= max_side:
+        return size
+    ratio = max_side / max(size)
+    return max(1, round(size[0] * ratio)), max(1, round(size[1] * ratio))
+
+
+def scale_to(image: Image.Image, max_side: Optional[int]) -> Image.Image:
+    """Downscale a PIL image so its longest side is at most max_side."""
+    size = scaled_size(image.size, max_side)
+    if size == image.size:
+        return image
+    # Area averaging keeps thin text strokes at about half the cost of LANCZOS
+    return image.resize(size, Image.BOX, reducing_gap=2.0)
+
+
+# --- upload timing -------------------------------------------------------------
+
+_measurement = threading.local()
+
+
+@contextmanager
+def measure_upload(result: Optional[dict] = None):
+    """
+    Collect upload timing for requests made on this thread inside the block.
+
+    Yields a dict that receives "upload" (seconds from sending the request to
+    its response headers, which is mostly upload time for large bodies) and
+    "bytes" (request body size) for the first request made. Pass the dict of
+    another thread's measurement (see current_measurement) to have a request
+    made on this thread fill it in.
+    """
+    result = {} if result is None else result
+    previous = getattr(_measurement, "current", None)
+    _measurement.current = result
+    try:
+        yield result
+    finally:
+        _measurement.current = previous
+
+
+def current_measurement() -> Optional[dict]:
+    """The dict measure_upload() is filling on this thread, if any."""
+    return getattr(_measurement, "current", None)
+
+
+def _request_sent(request: httpx.Request):
+    result = getattr(_measurement, "current", None)
+    if result is not None and "upload" not in result:
+        request.extensions["upload_started"] = time.perf_counter()
+
+
+def _response_started(response: httpx.Response):
+    request = response.request
+    started = request.extensions.get("upload_started")
+    result = getattr(_measurement, "current", None)
+    if started is None or result is None or "upload" in result:
+        return
+    result["upload"] = time.perf_counter() - started
+    result["bytes"] = int(request.headers.get("Content-Length", 0))
+
+
+def upload_timing_hooks() -> dict:
+    """
+    httpx event hooks that report upload timing to measure_upload().
+
+    Hooks rather than a transport wrapper, so the client keeps picking up
+    proxies from the environment.
+    """
+    return {"request": [_request_sent], "response": [_response_started]}
+
+
+# --- controller ------------------------------------------------------------------
+
+class LatencyController:
+    """
+    Steps along LADDER to keep the time until an answer starts near a target.
+
+    The time is smoothed with an exponential moving average. Above the target
+    the controller moves one step cheaper; well below it (under `headroom` of
+    the target) it moves one step back up. After a change it waits for
+    `cooldown` new measurements before moving again.
+    """
+
+    def __init__(self, target: float, min_side: int = 1024, min_quality: int = 60,
+                 allow_low_detail: bool = False, headroom: float = 0.6,
+                 cooldown: int = 2, alpha: float = 0.4):
+        self.target = target
+        self.headroom = headroom
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self.ladder: List[OperatingPoint] = [
+            point for point in LADDER
+            if (point.max_side is None or point.max_side >= min_side)
+            and point.quality >= min_quality
+            and (allow_low_detail or point.detail == "high")
+        ]
+        self.level = 0
+        self.average: Optional[float] = None
+        self.last: Dict[str, float] = {}
+        self.changes = 0
+        self._since_change = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["LatencyController"]:
+        """
+        Create a controller from LATENCY_TARGET (seconds; unset or 0 disables it),
+        LATENCY_MIN_SIDE, LATENCY_MIN_QUALITY and LATENCY_ALLOW_LOW_DETAIL.
+        """
+        target = cls.target_from_env()
+        if target <= 0:
+            return None
+        return cls(
+            target,
+            min_side=int(os.getenv("LATENCY_MIN_SIDE", "1024")),
+            min_quality=int(os.getenv("LATENCY_MIN_QUALITY", "60")),
+            allow_low_detail=os.getenv("LATENCY_ALLOW_LOW_DETAIL", "false").lower() == "true",
+        )
+
+    @staticmethod
+    def target_from_env() -> float:
+        """LATENCY_TARGET in seconds; 0 when no target is set."""
+        return float(os.getenv("LATENCY_TARGET", "0") or 0)
+
+    @property
+    def point(self) -> OperatingPoint:
+        with self._lock:
+            return self.ladder[self.level]
+
+    def observe(self, point: Optional[OperatingPoint], latency: float,
+                upload: Optional[float] = None, payload_bytes: Optional[int] = None):
+        """
+        Record one answered question.
+
+        Args:
+            point: Operating point the question's screenshot was encoded and sent
+                   at; None for requests that did not send it that way
+                   (text-only, or a lower detail chosen by the router). Only
+                   measurements at the current point count, so fast text-only
+                   answers do not pull the average down.
+            latency: Seconds from starting to encode until the first answer token
+            upload: Seconds spent sending the request, if measured
+            payload_bytes: Request size, if measured
+        """
+        with self._lock:
+            if point != self.ladder[self.level]:
+                return
+            self.last = {"latency": latency}
+            if upload is not None:
+                self.last["upload"] = upload
+            if upload and payload_bytes:
+                self.last["upload_rate"] = payload_bytes / upload
+            self.average = latency if self.average is None else (
+                self.alpha * latency + (1 - self.alpha) * self.average
+            )
+            self._since_change += 1
+            if self._since_change < self.cooldown:
+                return
+            if self.average > self.target and self.level < len(self.ladder) - 1:
+                self.level += 1
+            elif self.average < self.target * self.headroom and self.level > 0:
+                self.level -= 1
+            else:
+                return
+            # Measurements from the old operating point no longer apply
+            self.changes += 1
+            self._since_change = 0
+            self.average = None
+
+    def status(self) -> str:
+        """One-line description of the operating point and recent latency."""
+        point = self.point
+        with self._lock:
+            last = dict(self.last)
+        text = point.describe()
+        if "latency" in last:
+            text += f" · {last['latency']:.1f}s/{self.target:g}s"
+        if "upload_rate" in last:
+            text += f" · ↑{last['upload_rate'] * 8 / 1e6:.1f} Mbit/s"
+        return text
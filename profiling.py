@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Profiling mode for the Screen Context GPT Assistant.
+Wraps the stages of each question (capture, encode, request building,
+rendering) in cProfile and tracemalloc and writes a compact report per
+question plus a cumulative session summary.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+
+@dataclass
+class QuestionProfile:
+    """Measurements collected for one question."""
+    number: int
+    question: str
+    profile: cProfile.Profile = field(default_factory=cProfile.Profile)
+    stages: Dict[str, float] = field(default_factory=dict)
+    allocations: Dict[Tuple[str, int], List[int]] = field(default_factory=dict)
+    profiled: bool = False
+
+
+class NullProfiler:
+    """Profiler used when profiling is off; every hook is a no-op."""
+
+    enabled = False
+
+    def begin(self, question: str) -> None:
+        return None
+
+    def stage(self, profile, name: str, cpu: bool = True):
+        return nullcontext()
+
+    def finish(self, profile):
+        pass
+
+    def close(self):
+        pass
+
+
+class QuestionProfiler:
+    """
+    Collects cProfile and tracemalloc data per question.
+
+    Only one profiled stage runs at a time (stages of pipelined questions wait
+    for each other) so that the profiles and allocation diffs of different
+    questions do not mix.
+    """
+
+    enabled = True
+
+    def __init__(self, output_dir: str, top: int = 15):
+        self.output_dir = output_dir
+        self.top = top
+        os.makedirs(output_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._count = 0
+        self._session_stats = None
+        self._stage_totals = defaultdict(list)
+        self._allocation_totals = defaultdict(lambda: [0, 0])
+        self._started = time.time()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+
+    def begin(self, question: str) -> QuestionProfile:
+        """Start collecting measurements for a question."""
+        with self._lock:
+            self._count += 1
+            return QuestionProfile(self._count, question)
+
+    @contextmanager
+    def stage(self, profile: Optional[QuestionProfile], name: str, cpu: bool = True):
+        """
+        Measure one stage of a question.
+
+        Args:
+            profile: Question being measured (None disables measurement)
+            name: Stage name shown in the report
+            cpu: Profile functions and allocations; False only records wall time
+                 (used for waiting on the network)
+        """
+        if profile is None:
+            yield
+            return
+        if not cpu:
+            started = time.perf_counter()
+            try:
+                yield
+            finally:
+                profile.stages[name] = profile.stages.get(name, 0.0) + time.perf_counter() - started
+            return
+
+        with self._lock:
+            before = self._snapshot()
+            started = time.perf_counter()
+            profile.profiled = True
+            profile.profile.enable()
+            try:
+                yield
+            finally:
+                profile.profile.disable()
+                profile.stages[name] = profile.stages.get(name, 0.0) + time.perf_counter() - started
+                after = self._snapshot()
+                for diff in after.compare_to(before, "lineno"):
+                    if diff.size_diff <= 0:
+                        continue
+                    frame = diff.traceback[0]
+                    site = profile.allocations.setdefault((frame.filename, frame.lineno), [0, 0])
+                    site[0] += diff.size_diff
+                    site[1] += diff.count_diff
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        """Take a tracemalloc snapshot without the profiler's own allocations."""
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+
+    def finish(self, profile: Optional[QuestionProfile]):
+        """Write the report for a question and fold it into the session totals."""
+        if profile is None:
+            return
+        with self._lock:
+            stats = pstats.Stats(profile.profile) if profile.profiled else None
+            if stats is not None:
+                if self._session_stats is None:
+                    self._session_stats = pstats.Stats(profile.profile)
+                else:
+                    self._session_stats.add(profile.profile)
+            for name, seconds in profile.stages.items():
+                self._stage_totals[name].append(seconds)
+            for site, (size, count) in profile.allocations.items():
+                self._allocation_totals[site][0] += size
+                self._allocation_totals[site][1] += count
+
+            out = io.StringIO()
+            out.write(f"Question {profile.number}: {profile.question!r}\n\n")
+            out.write("Stages (wall time):\n")
+            for name, seconds in profile.stages.items():
+                out.write(f"  {name:<10} {seconds * 1000:10.1f} ms\n")
+            out.write("\n")
+            self._write_allocations(out, profile.allocations)
+            if stats is not None:
+                self._write_functions(out, stats)
+            path = os.path.join(self.output_dir, f"question-{profile.number:04d}.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(out.getvalue())
+            # Keep the summary current in case the app is killed rather than closed
+            self._write_summary()
+
+    def close(self) -> Optional[str]:
+        """Write the cumulative session summary; returns its path."""
+        with self._lock:
+            return self._write_summary()
+
+    def _write_summary(self) -> str:
+        """Write session-summary.txt; the caller holds the lock."""
+        out = io.StringIO()
+        out.write(f"Session summary: {self._count} question(s) in {time.time() - self._started:.0f}s\n\n")
+        out.write("Stages (wall time):   mean        max      total\n")
+        for name, values in self._stage_totals.items():
+            out.write(
+                f"  {name:<10} {sum(values) / len(values) * 1000:10.1f} ms"
+                f"{max(values) * 1000:10.1f} ms{sum(values):10.2f} s\n"
+            )
+        current, peak = tracemalloc.get_traced_memory()
+        out.write(f"\nTraced memory: {current / 1024 / 1024:.1f} MiB current, {peak / 1024 / 1024:.1f} MiB peak\n\n")
+        self._write_allocations(out, self._allocation_totals)
+        if self._session_stats is not None:
+            self._write_functions(out, self._session_stats)
+        path = os.path.join(self.output_dir, "session-summary.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(out.getvalue())
+        return path
+
+    def _write_allocations(self, out, allocations):
+        out.write("Largest allocation sites:\n")
+        ranked = sorted(allocations.items(), key=lambda item: item[1][0], reverse=True)
+        for (filename, lineno), (size, count) in ranked[:self.top]:
+            out.write(f"  {size / 1024:10.1f} KiB {count:7d} blocks  {filename}:{lineno}\n")
+        out.write("\n")
+
+    def _write_functions(self, out, stats: pstats.Stats):
+        out.write("Top functions (cumulative time):\n")
+        stats.stream = out
+        stats.sort_stats("cumulative").print_stats(self.top)
+
+
+def create_profiler(output_dir: Optional[str]):
+    """Return a QuestionProfiler writing to output_dir, or a NullProfiler if None."""
+    if not output_dir:
+        return NullProfiler()
+    return QuestionProfiler(output_dir)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Replay a recorded session through ScreenAssistantCore.
+Each recorded turn is prepared (routed, encoded) and sent again with the
+current code, against a local stub backend that answers with the recorded
+text after the recorded time to first token and streaming time. Compare
+the replayed build/encode times and payload sizes with the recording, or
+with an earlier replay saved with --save.
+
+Record a session with:
+    screen-assistant-gui --record sessions/
+
+Usage:
+    python replay_session.py sessions/session-20261019-101500.zip
+    python replay_session.py session.zip --no-latency --save before.json
+    python replay_session.py session.zip --no-latency --baseline before.json
+"""
+
+import argparse
+import csv
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+from session_archive import SessionArchive
+from stub_backend import StubBackend, StubReply
+
+SUMMARY_REPLY = "Summary of the earlier conversation: the user asked about their screen and followed the steps given."
+
+
+def median(values) -> float:
+    values = [v for v in values if v is not None]
+    return statistics.median(values) if values else 0.0
+
+
+def summarize(turns) -> dict:
+    """Medians and totals compared between recording, replay and baseline."""
+    return {
+        "turns": len(turns),
+        "build_ms": median(t["build_ms"] for t in turns),
+        "encode_ms": median(t["encode_ms"] for t in turns if t["encode_ms"]),
+        "request_ms": median(t["request_ms"] for t in turns),
+        "payload_kb": sum(t["payload_bytes"] or 0 for t in turns) / 1024,
+    }
+
+
+def replay_environment(settings: dict) -> dict:
+    """
+    Environment for the replayed assistant, so results do not depend on the
+    machine's environment or .env: routing and history settings come from the
+    recording, and features that adapt to the live network are off.
+
+    Args:
+        settings: Settings from the recording's manifest ({} for the defaults,
+                  as used by the soak harness)
+    """
+    return {
+        "WATCH_MODE": "false",
+        "CAPTURE_WORKER": "false",
+        "HEDGE": "false",
+        "LATENCY_TARGET": "0",
+        "PREUPLOAD": "false",
+        "ROUTER": "true" if settings.get("router", True) else "false",
+        "ROUTER_FAST_MODEL": settings.get("fast_model") or "gpt-4o-mini",
+        "HISTORY_MAX_IMAGES": str(settings.get("history_max_images", 3)),
+        "HISTORY_COMPACT_TURNS": str(settings.get("compact_turns", 6)),
+        # Not recorded; the defaults
+        "HISTORY_COMPACT_TOKENS": "8000",
+        "HISTORY_KEEP_TURNS": "2",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded session against a local stub backend")
+    parser.add_argument("archive", help="session archive written with --record")
+    parser.add_argument("--no-latency", action="store_true",
+                        help="answer immediately instead of with the recorded latencies")
+    parser.add_argument("--csv", help="write per-turn results to this CSV file")
+    parser.add_argument("--save", help="save the replay summary to this JSON file")
+    parser.add_argument("--baseline", help="compare with a summary saved by an earlier --save")
+    parser.add_argument("--tolerance", type=float, default=1.10,
+                        help="allowed replay/baseline ratio for payload and build/encode time")
+    parser.add_argument("--slack-ms", type=float, default=5.0, help="absolute slack for build/encode time (ms)")
+    args = parser.parse_args()
+
+    archive = SessionArchive(args.archive)
+    recorded_turns = archive.turns
+    print(f"Replaying {len(recorded_turns)} turn(s) from {args.archive} "
+          f"(recorded {time.strftime('%Y-%m-%d %H:%M', time.localtime(archive.manifest['created']))})")
+
+    current = {"turn": None, "payload": None}
+    lock = threading.Lock()
+
+    def responder(body: dict) -> StubReply:
+        if not body.get("stream"):
+            # Background summaries were not recorded; answer them at once
+            return StubReply(SUMMARY_REPLY)
+        with lock:
+            turn = current["turn"]
+            current["payload"] = len(json.dumps(body.get("messages", [])))
+        timings = turn["timings"]
+        if args.no_latency:
+            return StubReply(turn["answer"] or "")
+        ttft = timings.get("ttft", 0.0)
+        return StubReply(turn["answer"] or "", ttft, max(timings.get("request", 0.0) - ttft, 0.0))
+
+    backend = StubBackend(responder).start()
+    os.environ["OPENAI_BASE_URL"] = backend.base_url
+    os.environ["OPENAI_API_KEY"] = "stub"
+    # Set before the import: load_dotenv() does not override existing variables
+    os.environ.update(replay_environment(archive.manifest.get("settings", {})))
+    from screen_assistant_gui import ScreenAssistantCore
+
+    core = ScreenAssistantCore()
+    results = []
+    route_changes = 0
+    try:
+        for event in archive:
+            if event["type"] == "reset":
+                core.reset_conversation()
+                continue
+            screenshot = archive.image(event["image"])
+            prepared = core.prepare_question(event["question"], screenshot)
+            if prepared.route.image != event["route"]["image"]:
+                route_changes += 1
+
+            response = None
+            payload = None
+            if event["status"] == "ok":
+                with lock:
+                    current["turn"], current["payload"] = event, None
+                response = core.send_prepared(prepared)
+                with lock:
+                    payload = current["payload"]
+            # Cancelled and failed turns never reached the history; only their
+            # preparation is replayed
+
+            timings = prepared.timings
+            results.append({
+                "index": event["index"],
+                "question": event["question"],
+                "status": event["status"],
+                "route": prepared.route.image,
+                "recorded_route": event["route"]["image"],
+                "build_ms": timings.get("build", 0.0) * 1000,
+                "encode_ms": timings.get("encode", 0.0) * 1000,
+                "request_ms": timings.get("request", 0.0) * 1000 if event["status"] == "ok" else None,
+                "payload_bytes": payload,
+                "recorded_build_ms": event["timings"].get("build", 0.0) * 1000,
+                "recorded_encode_ms": event["timings"].get("encode", 0.0) * 1000,
+                "recorded_request_ms": event["timings"].get("request", 0.0) * 1000,
+                "recorded_payload_bytes": event.get("payload_bytes") if event["status"] == "ok" else None,
+                "ok": response is not None or event["status"] != "ok",
+            })
+    finally:
+        core.close()
+        backend.stop()
+        archive.close()
+
+    if not results:
+        print("No turns recorded.")
+        return
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(results)
+
+    replayed = summarize(results)
+    recorded = summarize([{
+        "build_ms": r["recorded_build_ms"],
+        "encode_ms": r["recorded_encode_ms"],
+        "request_ms": r["recorded_request_ms"] if r["status"] == "ok" else None,
+        "payload_bytes": r["recorded_payload_bytes"],
+    } for r in results])
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["summary"]
+
+    print(f"\n  {'metric':<18}{'recorded':>12}{'replayed':>12}" + (f"{'baseline':>12}" if baseline else ""))
+    for key, label in (("build_ms", "build (median ms)"), ("encode_ms", "encode (median ms)"),
+                       ("request_ms", "request (median ms)"), ("payload_kb", "payload (total KB)")):
+        row = f"  {label:<18}{recorded[key]:>12.1f}{replayed[key]:>12.1f}"
+        if baseline:
+            row += f"{baseline[key]:>12.1f}"
+        print(row)
+    if route_changes:
+        print(f"\n  {route_changes} turn(s) were routed differently than when recorded")
+
+    failures = []
+    failed = sum(1 for r in results if not r["ok"])
+    if failed:
+        failures.append(f"{failed} replayed request(s) failed")
+    if baseline:
+        if replayed["payload_kb"] > baseline["payload_kb"] * args.tolerance:
+            failures.append(f"payload grew from {baseline['payload_kb']:.1f} to {replayed['payload_kb']:.1f} KB")
+        for key in ("build_ms", "encode_ms"):
+            if replayed[key] > baseline[key] * args.tolerance + args.slack_ms:
+                failures.append(f"{key} grew from {baseline[key]:.1f} to {replayed[key]:.1f}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"archive": args.archive, "summary": replayed, "route_changes": route_changes}, f, indent=2)
+
+    if failures:
+        print("\nFAIL")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("\nPASS" if baseline else "\nDone")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Cancellable chat completion requests for the Screen Context GPT Assistant.
+Requests are streamed so that cancelling one closes the HTTP response and
+releases its connection instead of waiting for the full answer.
+
+For clients set up with cancellable(), each request also runs on an HTTP
+client of its own, so cancelling it shuts down its socket even while the
+screenshot is still uploading or the response headers are pending.
+"""
+
+import socket
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+import httpx
+
+
+class RequestCancelled(Exception):
+    """Raised when a request is cancelled before its answer is complete."""
+
+
+class CancelToken:
+    """Cancellation handle shared between the caller and an in-flight request."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._attached = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        """Cancel the request, closing its HTTP response and connection if open."""
+        with self._lock:
+            self._event.set()
+            attached = list(self._attached)
+        for item in attached:
+            try:
+                item.close()
+            except Exception:
+                pass
+
+    def attach(self, stream):
+        """Register an open stream or connection so cancel() can close it."""
+        with self._lock:
+            if not self._event.is_set():
+                self._attached.append(stream)
+                return
+        stream.close()
+        raise RequestCancelled()
+
+    def detach(self, stream):
+        """Forget a stream or connection that is no longer used by this request."""
+        with self._lock:
+            if stream in self._attached:
+                self._attached.remove(stream)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise RequestCancelled()
+
+
+class _Aborted(BaseException):
+    """
+    Raised inside httpx once a request's connection was shut down.
+
+    Not an Exception, so the OpenAI client does not treat it as a connection
+    error and retry the request on a new connection.
+    """
+
+
+class _RequestConnection:
+    """An HTTP client used by one request at a time; close() aborts that request."""
+
+    def __init__(self, client, make_http_client: Callable[[], httpx.Client]):
+        self.aborted = False
+        self._sockets = []
+        self._lock = threading.Lock()
+        self.http_client = make_http_client()
+        hooks = self.http_client.event_hooks
+        hooks["request"] = [self._on_request] + hooks.get("request", [])
+        self.http_client.event_hooks = hooks
+        self.client = client.with_options(http_client=self.http_client)
+
+    def _on_request(self, request: httpx.Request):
+        if self.aborted:
+            raise _Aborted()
+        traced = request.extensions.get("trace")
+
+        def trace(event: str, info: dict):
+            if traced:
+                traced(event, info)
+            if self.aborted and event.endswith(".failed"):
+                raise _Aborted()
+            if event.endswith((".connect_tcp.complete", ".start_tls.complete")):
+                # TLS wraps (and detaches) the TCP socket, so keep the newest
+                with self._lock:
+                    self._sockets = [s for s in self._sockets if s.fileno() != -1]
+                    self._sockets.append(info["return_value"].get_extra_info("socket"))
+
+        request.extensions["trace"] = trace
+
+    def close(self):
+        """Abort the request: shutting the socket down wakes a blocked send or receive."""
+        self.aborted = True
+        with self._lock:
+            sockets = list(self._sockets)
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class RequestConnections:
+    """
+    Hands each request an HTTP client of its own.
+
+    httpx gives no handle on a pooled connection until the response headers
+    have arrived, so a request sharing the client's pool cannot be aborted
+    while its body is uploading. A client per request can be: cancelling
+    shuts down exactly that request's sockets. Clients are reused by later
+    requests once their request is done, so connections stay warm.
+    """
+
+    def __init__(self, make_http_client: Callable[[], httpx.Client]):
+        self._make_http_client = make_http_client
+        self._idle: List[_RequestConnection] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def lease(self, client, token: CancelToken):
+        """The OpenAI client to send one request with; token.cancel() aborts it."""
+        with self._lock:
+            connection = self._idle.pop() if self._idle else None
+        if connection is None:
+            connection = _RequestConnection(client, self._make_http_client)
+        try:
+            token.attach(connection)
+            yield connection.client
+        except _Aborted:
+            raise RequestCancelled() from None
+        finally:
+            token.detach(connection)
+            if connection.aborted:
+                connection.http_client.close()
+            else:
+                with self._lock:
+                    self._idle.append(connection)
+
+
+_connections = weakref.WeakKeyDictionary()
+
+
+def cancellable(client, make_http_client: Callable[[], httpx.Client]):
+    """
+    Let cancellation abort this client's streamed requests at any point.
+
+    Args:
+        client: OpenAI client
+        make_http_client: Creates an httpx client configured like the client's own
+
+    Returns:
+        The same client
+    """
+    _connections[client] = RequestConnections(make_http_client)
+    return client
+
+
+@contextmanager
+def _request_client(client, token: CancelToken):
+    connections = _connections.get(client)
+    if connections is None:
+        yield client
+        return
+    with connections.lease(client, token) as request_client:
+        yield request_client
+
+
+def stream_completion(
+    client,
+    token: CancelToken,
+    on_delta: Optional[Callable[[str], None]] = None,
+    **kwargs,
+) -> str:
+    """
+    Run a streaming chat completion and return the full answer text.
+
+    Cancellation closes the stream and raises RequestCancelled. For clients
+    set up with cancellable() it also aborts a request that is still
+    uploading or waiting for headers; otherwise it takes effect once the
+    response headers arrive.
+
+    Args:
+        client: OpenAI client
+        token: Cancellation token for this request
+        on_delta: Optional callback receiving each text fragment as it arrives
+        **kwargs: Arguments for chat.completions.create
+
+    Returns:
+        Answer text
+    """
+    token.raise_if_cancelled()
+
+    def text_of(chunk):
+        return chunk.choices[0].delta.content if chunk.choices else None
+
+    with _request_client(client, token) as request_client:
+        stream = request_client.chat.completions.create(stream=True, **kwargs)
+        return _collect(stream, token, on_delta, text_of)
+
+
+def responses_input(messages: List[dict]) -> List[dict]:
+    """Convert chat messages to Responses API input items."""
+    items = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            parts = []
+            for part in content:
+                if part.get("type") == "text":
+                    parts.append({"type": "input_text", "text": part["text"]})
+                elif part.get("type") == "image_url":
+                    image = part["image_url"]
+                    parts.append({"type": "input_image", "image_url": image["url"],
+                                  "detail": image.get("detail", "auto")})
+                else:
+                    parts.append(part)  # already a Responses part, e.g. an uploaded image
+            content = parts
+        items.append({"role": message["role"], "content": content})
+    return items
+
+
+def stream_response(
+    client,
+    token: CancelToken,
+    on_delta: Optional[Callable[[str], None]] = None,
+    **kwargs,
+) -> str:
+    """
+    Like stream_completion, but through the Responses API.
+
+    Used for requests that reference uploaded files, which chat completions
+    does not accept for images. Takes the same chat-style arguments: messages
+    are converted with responses_input and max_tokens becomes
+    max_output_tokens.
+    """
+    messages = kwargs.pop("messages")
+    if "max_tokens" in kwargs:
+        kwargs["max_output_tokens"] = kwargs.pop("max_tokens")
+    token.raise_if_cancelled()
+
+    def text_of(event):
+        if event.type == "response.output_text.delta":
+            return event.delta
+        if event.type in ("error", "response.failed"):
+            error = getattr(event, "response", None) and event.response.error
+            raise RuntimeError(f"Response failed: {getattr(error or event, 'message', event.type)}")
+        return None
+
+    with _request_client(client, token) as request_client:
+        stream = request_client.responses.create(stream=True, input=responses_input(messages), **kwargs)
+        return _collect(stream, token, on_delta, text_of)
+
+
+def _collect(stream, token: CancelToken, on_delta: Optional[Callable[[str], None]],
+             text_of: Callable[[object], Optional[str]]) -> str:
+    """Read a stream of events into the answer text, honouring cancellation."""
+    token.attach(stream)
+    parts = []
+    try:
+        for event in stream:
+            token.raise_if_cancelled()
+            delta = text_of(event)
+            if delta:
+                parts.append(delta)
+                if on_delta:
+                    on_delta(delta)
+    except RequestCancelled:
+        raise
+    except Exception:
+        if token.cancelled:
+            raise RequestCancelled() from None
+        raise
+    finally:
+        token.detach(stream)
+        stream.close()
+    token.raise_if_cancelled()
+    return "".join(parts)
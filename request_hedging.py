@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Hedged chat completion requests for the Screen Context GPT Assistant.
+If a request has not produced its first token by a deadline taken from a
+high percentile of recent time-to-first-token measurements, a duplicate
+request is sent (to the same or a secondary model). Whichever starts
+answering first is streamed to the caller and the other one is cancelled,
+which cuts the slow tail at the cost of a few extra requests.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+from latency_controller import current_measurement, measure_upload
+from request_control import CancelToken, RequestCancelled, stream_completion
+
+logger = logging.getLogger("screen_assistant.hedging")
+
+PRIMARY, HEDGE = 0, 1
+
+
+class _Race:
+    """State shared by the two attempts of one hedged request."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tokens = [CancelToken(), CancelToken()]
+        self.first_token: Dict[int, float] = {}
+        self.winner: Optional[int] = None
+        self.decided: Optional[float] = None  # when the winner was chosen and the loser cancelled
+        self.launched: Optional[float] = None
+        self.closed = False  # no hedge may start
+        self.running = 0  # attempts whose request has not ended yet
+        self.release: Optional[Callable[[], None]] = None  # frees the hedge's admission slot
+        self.finished = queue.Queue()  # (attempt, answer, error) as attempts end
+
+    def claim(self, index: int) -> bool:
+        """Let the first attempt to answer win; the other one is cancelled."""
+        with self.lock:
+            if self.winner is None:
+                self.winner = index
+                self.decided = time.perf_counter()
+            won = self.winner == index
+        if won:
+            self.tokens[1 - index].cancel()
+        return won
+
+    def close(self):
+        """Cancel both attempts (called through the caller's CancelToken)."""
+        with self.lock:
+            self.closed = True
+        for token in self.tokens:
+            token.cancel()
+        # Wake the caller even while both attempts are still blocked
+        self.finished.put((None, None, None))
+
+
+class HedgePolicy:
+    """
+    Decides when to send a duplicate request and keeps hedging statistics.
+
+    The deadline is the `percentile` of the last `window` first-token times of
+    the model (at least `min_delay`); until `min_samples` are known,
+    `initial_delay` is used. Requests cancelled because the hedge won count
+    with the time they had waited, so slow periods still raise the deadline.
+    At most `max_rate` of recent requests are hedged, so a struggling backend
+    does not get twice the load.
+
+    If `admission` is set (an object with try_acquire() and release(), such as
+    the API server's AdmissionController), a hedge only starts when it can
+    take an extra slot without waiting; the slot is held until both attempts
+    have ended.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        model: Optional[str] = None,
+        initial_delay: float = 3.0,
+        min_delay: float = 0.5,
+        min_samples: int = 20,
+        window: int = 200,
+        max_rate: float = 0.2,
+        log_path: Optional[str] = None,
+    ):
+        self.percentile = percentile
+        self.model = model
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.max_rate = max_rate
+        self.log_path = log_path
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.skipped = 0  # hedges not started for lack of an admission slot
+        self.admission = None
+        self.history = deque(maxlen=200)
+        self._window = window
+        self._samples: Dict[str, deque] = {}
+        self._recent = deque(maxlen=50)  # whether each recent request was hedged
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["HedgePolicy"]:
+        """Create a policy if HEDGE=true, configured from HEDGE_* environment variables."""
+        if os.getenv("HEDGE", "false").lower() != "true":
+            return None
+        return cls(
+            percentile=float(os.getenv("HEDGE_PERCENTILE", "95")),
+            model=os.getenv("HEDGE_MODEL") or None,
+            initial_delay=float(os.getenv("HEDGE_INITIAL_DELAY", "3")),
+            min_delay=float(os.getenv("HEDGE_MIN_DELAY", "0.5")),
+            max_rate=float(os.getenv("HEDGE_MAX_RATE", "0.2")),
+            log_path=os.getenv("HEDGE_LOG") or None,
+        )
+
+    def deadline(self, model: str) -> float:
+        """Seconds to wait for the first token before hedging a request to `model`."""
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if len(samples) < self.min_samples:
+            return self.initial_delay
+        index = min(len(samples) - 1, int(len(samples) * self.percentile / 100))
+        return max(self.min_delay, samples[index])
+
+    def _observe(self, model: str, ttft: float):
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=self._window)).append(ttft)
+
+    def _may_hedge(self) -> bool:
+        with self._lock:
+            return not self._recent or sum(self._recent) / len(self._recent) < self.max_rate
+
+    def complete(self, client, token: CancelToken,
+                 on_delta: Optional[Callable[[str], None]] = None,
+                 request: Optional[Callable[..., str]] = None, **kwargs) -> str:
+        """
+        Drop-in replacement for stream_completion that hedges slow requests.
+
+        Both attempts run on their own threads, so the caller returns as soon
+        as the winner finishes even if the loser is still waiting for its
+        first byte; the loser's stream is closed once it unblocks.
+
+        `request` sends each attempt (default: stream_completion; e.g.
+        stream_response for requests referencing uploaded files).
+        """
+        request = request or stream_completion
+        model = kwargs.pop("model")
+        hedge_model = self.model or model
+        deadline = self.deadline(model)
+        measurement = current_measurement()
+        race = _Race()
+        token.attach(race)
+        started = time.perf_counter()
+
+        def forward(index: int) -> Callable[[str], None]:
+            def on_text(text):
+                with race.lock:
+                    first = index not in race.first_token
+                    if first:
+                        race.first_token[index] = time.perf_counter()
+                if first and not race.claim(index):
+                    raise RequestCancelled()
+                if on_delta:
+                    on_delta(text)
+            return on_text
+
+        def attempt(index: int, model: str):
+            answer, error = None, None
+            try:
+                # Only the primary request reports upload timing to the caller
+                with measure_upload(measurement if index == PRIMARY else None):
+                    answer = request(
+                        client, race.tokens[index], on_delta=forward(index), model=model, **kwargs
+                    )
+            except BaseException as e:
+                error = e
+            with race.lock:
+                race.running -= 1
+                release = race.release if race.running == 0 else None
+            if release:
+                release()
+            race.finished.put((index, answer, error))
+
+        def hedge():
+            with race.lock:
+                if race.closed or race.winner is not None or not self._may_hedge():
+                    return
+                if self.admission:
+                    if not self.admission.try_acquire():
+                        with self._lock:
+                            self.skipped += 1
+                        logger.info("not hedging %s: no free admission slot", model)
+                        return
+                    race.release = self.admission.release
+                race.launched = time.perf_counter()
+                race.running += 1
+            logger.info("hedging %s after %.2fs without a first token (to %s)", model, deadline, hedge_model)
+            attempt(HEDGE, hedge_model)
+
+        race.running = 1
+        threading.Thread(target=attempt, args=(PRIMARY, model), daemon=True).start()
+        timer = threading.Timer(deadline, hedge)
+        timer.daemon = True
+        timer.start()
+        errors: Dict[int, Optional[BaseException]] = {}
+        try:
+            while True:
+                index, answer, error = race.finished.get()
+                token.raise_if_cancelled()
+                if index is None:
+                    continue
+                errors[index] = error
+                if error is None and race.claim(index):  # an empty answer still wins
+                    return answer
+                if error is not None and race.winner == index:
+                    raise error  # failed after its answer had started
+                with race.lock:
+                    # No hedge is started once the primary has ended
+                    race.closed = race.closed or index == PRIMARY
+                    other_running = 1 - index not in errors and (index == HEDGE or race.launched is not None)
+                if not other_running:
+                    failures = [e for e in errors.values() if e and not isinstance(e, RequestCancelled)]
+                    raise failures[0] if failures else (error or RequestCancelled())
+        finally:
+            timer.cancel()
+            race.close()
+            self._record(model, hedge_model, deadline, started, race)
+
+    def _record(self, model: str, hedge_model: str, deadline: float, started: float, race: _Race):
+        """Update the first-token samples and hedging statistics for a request."""
+        with race.lock:
+            hedged = race.launched is not None
+            first_token = dict(race.first_token)
+            decided = race.decided
+        if PRIMARY in first_token:
+            self._observe(model, first_token[PRIMARY] - started)
+        elif race.winner == HEDGE:
+            # Censored: the primary had waited at least until it was cancelled
+            self._observe(model, first_token.get(HEDGE, decided) - started)
+        if HEDGE in first_token:
+            self._observe(hedge_model, first_token[HEDGE] - race.launched)
+        with self._lock:
+            self.requests += 1
+            self._recent.append(hedged)
+            if hedged:
+                self.hedged += 1
+                if race.winner == HEDGE:
+                    self.hedge_wins += 1
+        entry = {
+            "time": time.time(),
+            "model": model,
+            "deadline_s": round(deadline, 3),
+            "hedged": hedged,
+            "hedge_model": hedge_model if hedged else None,
+            "winner": {PRIMARY: "primary", HEDGE: "hedge"}.get(race.winner),
+            "ttft_s": round(min(first_token.values()) - started, 3) if first_token else None,
+        }
+        self.history.append(entry)
+        if hedged:
+            logger.info("hedged request to %s won by %s", model, entry["winner"])
+        if self.log_path:
+            try:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+            except OSError as e:
+                logger.warning("Could not write hedging log: %s", e)
+
+    def stats(self) -> dict:
+        """Request, hedge and hedge-win counts."""
+        with self._lock:
+            return {"requests": self.requests, "hedged": self.hedged, "hedge_wins": self.hedge_wins,
+                    "skipped": self.skipped}
+
+    def status(self) -> str:
+        """One-line summary of how often requests were hedged and who won."""
+        stats = self.stats()
+        requests, hedged, wins = stats["requests"], stats["hedged"], stats["hedge_wins"]
+        if not requests:
+            return "hedging: no requests yet"
+        text = f"hedged {hedged}/{requests} ({hedged / requests:.0%})"
+        if hedged:
+            text += f", hedge won {wins}"
+        return text
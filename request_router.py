@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Local rule-based request routing for the Screen Context GPT Assistant.
+Classifies each question (plus whether the screen changed since the last one)
+and picks how much of the screenshot to send, which model to use and how many
+tokens to allow, so cheap follow-ups get fast answers.
+"""
+
+import json
+import logging
+import os
+import re
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+logger = logging.getLogger("screen_assistant.router")
+
+# Questions that depend on reading small on-screen details
+FINE_DETAIL_CUES = re.compile(
+    r"\b(read|say|says|said|text|error|warning|message|code|line|lines|exact|exactly|"
+    r"number|value|version|log|logs|spell|typo|url|path|cell|field|small|tiny)\b"
+)
+
+# Questions about the screen as a whole, answerable from a downscaled image
+OVERVIEW_CUES = re.compile(
+    r"\b(what app|which app|what program|what am i looking at|what is this|"
+    r"summari[sz]e|overview|layout|what'?s on (my|the) screen|describe)\b"
+)
+
+# Acknowledgements and explicit references to the previous answer, which
+# usually only need that answer and not a new look at the screen
+FOLLOW_UP_CUES = re.compile(
+    r"^(thanks|thank you|thx|ok|okay|cool|great|got it|"
+    r"(and |also )?(what|how) about (step \d+|the (next|last|previous|first) step)|(and )?step \d+|"
+    r"(can you )?(explain|elaborate on) (that|it|this step|step \d+|the (last|previous|first) step)|"
+    r"elaborate|more detail|again|shorter|longer|(say|explain) (that|it) again|"
+    r"why did you|what did you mean|what('?s| is) (the )?next( step)?|next step)\b"
+)
+
+# Words that mark a new problem even in a short follow-up; those questions
+# get a fresh look at the screen
+NEW_PROBLEM_CUES = re.compile(
+    r"\b(errors?|fail|fails|failed|failing|failure|broken|breaks?|crash(es|ed|ing)?|bugs?|"
+    r"wrong|issue|problem|exception|stuck|not working|(doesn|isn|won|can)'?t)\b"
+)
+
+
+@dataclass
+class RouteDecision:
+    """How a single question will be sent upstream."""
+    image: str  # "none", "low" or "high"
+    model: str
+    max_tokens: int
+    reason: str
+
+    @property
+    def detail(self) -> Optional[str]:
+        """Image detail level for the request, or None for a text-only request."""
+        return None if self.image == "none" else self.image
+
+
+class RequestRouter:
+    """Picks image detail, model and max_tokens per question."""
+
+    def __init__(
+        self,
+        model: str = "gpt-4o",
+        fast_model: str = "gpt-4o-mini",
+        max_tokens: int = 1500,
+        enabled: bool = True,
+        log_path: Optional[str] = None,
+    ):
+        self.model = model
+        self.fast_model = fast_model
+        self.max_tokens = max_tokens
+        self.enabled = enabled
+        self.log_path = log_path
+        self.history = deque(maxlen=200)
+
+    @classmethod
+    def from_env(cls, model: str, max_tokens: int) -> "RequestRouter":
+        """Create a router configured from ROUTER_* environment variables."""
+        return cls(
+            model=model,
+            fast_model=os.getenv("ROUTER_FAST_MODEL", "gpt-4o-mini"),
+            max_tokens=max_tokens,
+            enabled=os.getenv("ROUTER", "true").lower() == "true",
+            log_path=os.getenv("ROUTER_LOG") or None,
+        )
+
+    def route(self, question: str, screen_changed: bool, has_history: bool) -> RouteDecision:
+        """
+        Classify a question and decide how to send it.
+
+        Args:
+            question: User's question
+            screen_changed: Whether the screen differs from the previous question's
+            has_history: Whether earlier turns (with their screenshots) are in context
+
+        Returns:
+            RouteDecision for the request
+        """
+        if not self.enabled:
+            return RouteDecision("high", self.model, self.max_tokens, "router disabled")
+
+        text = question.lower().strip()
+        short = len(text.split()) <= 12
+
+        if FINE_DETAIL_CUES.search(text):
+            return RouteDecision("high", self.model, self.max_tokens, "fine detail")
+        if (has_history and not screen_changed and short and FOLLOW_UP_CUES.search(text)
+                and not NEW_PROBLEM_CUES.search(text)):
+            return RouteDecision("none", self.fast_model, min(600, self.max_tokens), "follow-up, screen unchanged")
+        if has_history and not screen_changed:
+            return RouteDecision("low", self.model, min(1000, self.max_tokens), "screen already seen")
+        if OVERVIEW_CUES.search(text):
+            return RouteDecision("low", self.model, min(1000, self.max_tokens), "overview")
+        return RouteDecision("high", self.model, self.max_tokens, "default")
+
+    def record(self, question: str, decision: RouteDecision, latency: float, ok: bool):
+        """Log a routing decision together with how the request went."""
+        entry = {
+            "time": time.time(),
+            "question_chars": len(question),
+            **asdict(decision),
+            "latency_s": round(latency, 3),
+            "ok": ok,
+        }
+        self.history.append(entry)
+        logger.info(
+            "route image=%s model=%s max_tokens=%d reason=%r latency=%.2fs ok=%s",
+            decision.image, decision.model, decision.max_tokens, decision.reason, latency, ok
+        )
+        if self.log_path:
+            try:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+            except OSError as e:
+                logger.warning("Could not write routing log: %s", e)
@@ -5,23 +5,37 @@ A tool that allows you to ask GPT questions with automatic screen capture for co
 """
 
 import os
+import argparse
 import base64
 import io
+import time
+from dataclasses import replace
 from typing import Optional
 from dotenv import load_dotenv
 from openai import OpenAI
+import httpx
 from PIL import Image
 import mss
 from rich.console import Console
 from rich.panel import Panel
 from rich.prompt import Prompt
 from rich.markdown import Markdown
+from frame_buffer import watcher_from_env, keyframe_content, frame_signature, frame_difference
+from request_router import RequestRouter, RouteDecision
+from request_control import CancelToken, stream_completion
+from request_hedging import HedgePolicy
+from profiling import NullProfiler, create_profiler
+from capture_region import CAPTURE_MODES, CaptureSettings, terminal_window
+from latency_controller import LatencyController, measure_upload, scale_to, upload_timing_hooks
 
 # Load environment variables
 load_dotenv()
 
 console = Console()
 
+# Signature difference above which the screen counts as changed between questions
+SCREEN_CHANGE_THRESHOLD = 0.02
+
 
 class ScreenAssistant:
     """Main class for the screen context GPT assistant."""
@@ -34,20 +48,49 @@ class ScreenAssistant:
             console.print("[yellow]Please set it in a .env file or export it as an environment variable.[/yellow]")
             raise ValueError("OPENAI_API_KEY is required")
         
-        self.client = OpenAI(api_key=api_key)
+        # Optional latency target (LATENCY_TARGET): screenshot size, quality and
+        # detail are adjusted to keep the time until the answer starts near it
+        self.latency = LatencyController.from_env()
+        http_client = None
+        if self.latency:
+            # Reports upload timing to the controller
+            http_client = httpx.Client(event_hooks=upload_timing_hooks())
+        
+        self.client = OpenAI(api_key=api_key, http_client=http_client)
         self.model = "gpt-4o"  # Using GPT-4o which has vision capabilities
+        self.capture_settings = CaptureSettings.from_env()
+        # Window mode captures the window the question is about, not this terminal
+        self.terminal_window = terminal_window()
+        
+        # Optional watch mode (WATCH_MODE=true): recent keyframes are attached to questions
+        self.watcher = watcher_from_env(self.capture_screen)
+        self.watch_attach_frames = int(os.getenv("WATCH_ATTACH_FRAMES", "3"))
+        
+        # Per-question choice of image detail, model and max_tokens
+        self.router = RequestRouter.from_env(self.model, max_tokens=1000)
+        
+        # Optional hedging (HEDGE=true): a duplicate request is sent when the first
+        # token is later than usual, and the slower of the two is cancelled
+        self.hedging = HedgePolicy.from_env()
+        self._last_signature = None
+        
+        # Replaced by a QuestionProfiler when started with --profile
+        self.profiler = NullProfiler()
     
     def capture_screen(self) -> Optional[Image.Image]:
         """
-        Capture a screenshot of the entire screen.
+        Capture a screenshot of the configured capture area.
         
         Returns:
             PIL Image object or None if capture fails
         """
         try:
             with mss.mss() as sct:
-                # Get the primary monitor
-                monitor = sct.monitors[1]  # 0 is all monitors, 1 is primary
+                # Primary monitor, active window, cursor region or selected rectangle
+                settings = self.capture_settings
+                if self.terminal_window:
+                    settings = replace(settings, exclude=(self.terminal_window,))
+                monitor = settings.resolve(sct.monitors)
                 
                 # Capture the screen
                 screenshot = sct.grab(monitor)
@@ -60,77 +103,154 @@ class ScreenAssistant:
             console.print(f"[red]Error capturing screen: {e}[/red]")
             return None
     
-    def image_to_base64(self, image: Image.Image) -> str:
+    def image_to_base64(self, image: Image.Image, quality: int = 85, max_side: Optional[int] = None) -> str:
         """
         Convert PIL Image to base64 string.
         
         Args:
             image: PIL Image object
+            quality: JPEG quality
+            max_side: Downscale so the longest side is at most this many pixels
             
         Returns:
             Base64 encoded string
         """
         buffered = io.BytesIO()
+        image = scale_to(image, max_side)
         # Convert to RGB if necessary (for PNG with transparency)
         if image.mode != "RGB":
             image = image.convert("RGB")
-        image.save(buffered, format="JPEG", quality=85)
+        image.save(buffered, format="JPEG", quality=quality)
         img_str = base64.b64encode(buffered.getvalue()).decode()
         return img_str
     
-    def ask_gpt(self, question: str, screenshot: Image.Image) -> Optional[str]:
+    def ask_gpt(self, question: str, screenshot: Image.Image, profile=None) -> Optional[str]:
         """
         Send question and screenshot to GPT-4 Vision API.
         
         Args:
             question: User's question
             screenshot: PIL Image of the screen
+            profile: Profiling handle for the question, if profiling is on
             
         Returns:
             GPT response text or None if error
         """
         try:
-            # Convert screenshot to base64
-            base64_image = self.image_to_base64(screenshot)
+            asked = time.perf_counter()
+            first_token = []
+            
+            # Route the question: text-only, low or high detail, and which model
+            with self.profiler.stage(profile, "build"):
+                signature = frame_signature(screenshot)
+                screen_changed = frame_difference(signature, self._last_signature) >= SCREEN_CHANGE_THRESHOLD
+                self._last_signature = signature
+                route = self.router.route(question, screen_changed, has_history=False)
+                point = self.latency.point if self.latency else None
+                if point and route.detail == "high" and point.detail == "low":
+                    route = RouteDecision("low", route.model, route.max_tokens, route.reason + ", latency target")
             
-            console.print("[cyan]📸 Screenshot captured![/cyan]")
-            console.print("[cyan]🤖 Sending to GPT...[/cyan]\n")
+            content = [
+                {
+                    "type": "text",
+                    "text": question
+                }
+            ]
+            if route.detail:
+                # Convert screenshot to base64
+                with self.profiler.stage(profile, "encode"):
+                    if point:
+                        base64_image = self.image_to_base64(screenshot, point.quality, point.max_side)
+                    else:
+                        base64_image = self.image_to_base64(screenshot)
+                
+                keyframes = []
+                if self.watcher:
+                    keyframes = self.watcher.relevant_frames(screenshot, self.watch_attach_frames)
+                
+                console.print("[cyan]📸 Screenshot captured![/cyan]")
+                if keyframes:
+                    console.print(f"[cyan]🎞️  Attaching {len(keyframes)} earlier keyframe(s) from watch mode[/cyan]")
+                
+                content.extend(keyframe_content(keyframes))
+                content.append({
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:image/jpeg;base64,{base64_image}",
+                        "detail": route.detail
+                    }
+                })
+            
+            console.print(f"[cyan]🤖 Sending to {route.model} ({route.image} detail, {route.reason})...[/cyan]\n")
             
             # Prepare the message with image
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a helpful assistant that can see the user's screen. Analyze the screenshot and provide helpful, accurate answers to the user's questions. Be specific and actionable in your responses."
-                    },
-                    {
-                        "role": "user",
-                        "content": [
+            started = time.perf_counter()
+            try:
+                with self.profiler.stage(profile, "request", cpu=False), measure_upload() as upload:
+                    answer = (self.hedging.complete if self.hedging else stream_completion)(
+                        self.client,
+                        CancelToken(),
+                        on_delta=lambda text: first_token or first_token.append(time.perf_counter()),
+                        model=route.model,
+                        messages=[
                             {
-                                "type": "text",
-                                "text": question
+                                "role": "system",
+                                "content": "You are a helpful assistant that can see the user's screen. Analyze the screenshot and provide helpful, accurate answers to the user's questions. Be specific and actionable in your responses."
                             },
                             {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}",
-                                    "detail": "high"
-                                }
+                                "role": "user",
+                                "content": content
                             }
-                        ]
-                    }
-                ],
-                max_tokens=1000,
-                temperature=0.7
-            )
+                        ],
+                        max_tokens=route.max_tokens,
+                        temperature=0.7
+                    )
+            except Exception:
+                self.router.record(question, route, time.perf_counter() - started, ok=False)
+                raise
+            self.router.record(question, route, time.perf_counter() - started, ok=True)
+            if self.latency and first_token:
+                # Text-only and router low-detail answers say nothing about the operating point
+                sent_at = point if route.detail == point.detail else None
+                self.latency.observe(sent_at, first_token[0] - asked, upload.get("upload"), upload.get("bytes"))
             
-            return response.choices[0].message.content
+            return answer
             
         except Exception as e:
             console.print(f"[red]Error communicating with GPT: {e}[/red]")
             return None
     
+    def answer_question(self, question: str, profile=None):
+        """Capture the screen, ask GPT and display the response."""
+        # Capture screen
+        console.print("[cyan]📸 Capturing screen...[/cyan]")
+        with self.profiler.stage(profile, "capture"):
+            screenshot = self.capture_screen()
+        
+        if not screenshot:
+            console.print("[red]Failed to capture screen. Please try again.[/red]")
+            return
+        
+        # Ask GPT
+        response = self.ask_gpt(question, screenshot, profile)
+        
+        if response:
+            # Display response in a nice format
+            with self.profiler.stage(profile, "render"):
+                console.print()
+                console.print(Panel(
+                    Markdown(response),
+                    title="[bold]GPT Response[/bold]",
+                    border_style="green"
+                ))
+                if self.latency:
+                    console.print(f"[dim]⏱  {self.latency.status()}[/dim]")
+                if self.hedging:
+                    console.print(f"[dim]⏱  {self.hedging.status()}[/dim]")
+                console.print()
+        else:
+            console.print("[red]Failed to get response from GPT.[/red]")
+    
     def run(self):
         """Main interactive loop."""
         console.print(Panel.fit(
@@ -140,6 +260,12 @@ class ScreenAssistant:
         ))
         console.print()
         
+        console.print(f"[dim]Capturing: {self.capture_settings.describe()}[/dim]\n")
+        
+        if self.watcher:
+            self.watcher.start()
+            console.print(f"[cyan]👀 Watch mode enabled (every {self.watcher.interval:g}s)[/cyan]\n")
+        
         while True:
             try:
                 # Get user question
@@ -154,44 +280,48 @@ class ScreenAssistant:
                     console.print("[yellow]Please enter a question.[/yellow]")
                     continue
                 
-                # Capture screen
-                console.print("[cyan]📸 Capturing screen...[/cyan]")
-                screenshot = self.capture_screen()
-                
-                if not screenshot:
-                    console.print("[red]Failed to capture screen. Please try again.[/red]")
-                    continue
-                
-                # Ask GPT
-                response = self.ask_gpt(question, screenshot)
-                
-                if response:
-                    # Display response in a nice format
-                    console.print()
-                    console.print(Panel(
-                        Markdown(response),
-                        title="[bold]GPT Response[/bold]",
-                        border_style="green"
-                    ))
-                    console.print()
-                else:
-                    console.print("[red]Failed to get response from GPT.[/red]")
+                profile = self.profiler.begin(question)
+                try:
+                    self.answer_question(question, profile)
+                finally:
+                    self.profiler.finish(profile)
                 
             except KeyboardInterrupt:
                 console.print("\n[yellow]Interrupted. Goodbye![/yellow]")
                 break
             except Exception as e:
                 console.print(f"[red]Unexpected error: {e}[/red]")
+        
+        if self.watcher:
+            self.watcher.stop()
+            console.print(f"[dim]{self.watcher.summary()}[/dim]")
+        
+        if self.profiler.enabled:
+            console.print(f"[dim]Profile summary written to {self.profiler.close()}[/dim]")
 
 
 def main():
     """Entry point for the application."""
+    parser = argparse.ArgumentParser(description="Screen Context GPT Assistant")
+    parser.add_argument(
+        "--profile", nargs="?", const="profiles", metavar="DIR",
+        help="write per-question CPU and allocation reports to DIR (default: ./profiles)"
+    )
+    parser.add_argument("--capture-mode", choices=CAPTURE_MODES, help="which part of the screen to capture")
+    parser.add_argument("--region", metavar="X,Y,W,H", help="rectangle to capture (implies --capture-mode region)")
+    args = parser.parse_args()
+    
     try:
         assistant = ScreenAssistant()
+        assistant.capture_settings = CaptureSettings.from_env(args.capture_mode, args.region)
+        if args.profile:
+            assistant.profiler = create_profiler(args.profile)
+            console.print(f"[dim]Profiling enabled; reports are written to {args.profile}/[/dim]")
         assistant.run()
-    except ValueError:
+    except ValueError as e:
         # API key error already handled
-        pass
+        if "OPENAI_API_KEY" not in str(e):
+            console.print(f"[red]Error: {e}[/red]")
     except Exception as e:
         console.print(f"[red]Fatal error: {e}[/red]")
 
@@ -5,54 +5,181 @@ A Spotlight-like interface for asking GPT questions with automatic screen captur
 """
 
 import os
+import argparse
 import base64
 import io
+import queue
 import threading
+import time
 import tkinter as tk
 from tkinter import ttk, scrolledtext
-from typing import Optional
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, Optional, Union
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import BadRequestError, OpenAI
 from PIL import Image, ImageTk
 import mss
 import markdown
-import mss
-import markdown
-import win32con
 import httpx
+from frame_buffer import watcher_from_env, keyframe_content, frame_signature, frame_difference
+from conversation_compactor import ConversationCompactor, prune_images
+from request_router import RequestRouter, RouteDecision
+from request_control import CancelToken, RequestCancelled, cancellable, stream_completion, stream_response
+from request_hedging import HedgePolicy
+from profiling import NullProfiler, create_profiler
+from capture_worker import CaptureWorker, EncodedFrame
+from capture_region import CAPTURE_MODES, CaptureSettings, active_window
+from session_archive import SessionRecorder
+from assistant_client import DaemonClient, DaemonError
+from latency_controller import LatencyController, measure_upload, scale_to, upload_timing_hooks
+from image_upload import ImageUploader, PreUploadedImage, file_part, file_rejected, referenced_files
 
 # Load environment variables
 load_dotenv()
 
+# Signature difference above which the screen counts as changed between questions
+SCREEN_CHANGE_THRESHOLD = 0.02
+
+# Seconds the window waits for the pre-upload capture before it is shown anyway
+PREUPLOAD_CAPTURE_WAIT = 0.25
+
+
+def create_http_client(keepalive_expiry: Optional[float] = None) -> httpx.Client:
+    """
+    Create the HTTP client requests are sent with.
+    
+    Args:
+        keepalive_expiry: Seconds idle connections stay pooled (httpx default: 5)
+    """
+    # Configure SSL verification
+    disable_ssl = os.getenv("DISABLE_SSL_VERIFY", "false").lower() == "true"
+    limits = httpx.Limits(max_connections=100, max_keepalive_connections=20,
+                          keepalive_expiry=keepalive_expiry if keepalive_expiry is not None else 5.0)
+    # With a latency target, event hooks report upload timing to the controller
+    hooks = upload_timing_hooks() if LatencyController.target_from_env() > 0 else None
+    return httpx.Client(verify=not disable_ssl, limits=limits, event_hooks=hooks)
+
+
+def create_client(keepalive_expiry: Optional[float] = None) -> OpenAI:
+    """
+    Create the OpenAI client.
+    
+    Args:
+        keepalive_expiry: Seconds idle connections stay pooled (httpx default: 5)
+    """
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY is required")
+    
+    client = OpenAI(api_key=api_key, http_client=create_http_client(keepalive_expiry))
+    # Streamed requests get HTTP clients of their own, so Escape and Reset can
+    # abort a screenshot that is still uploading
+    return cancellable(client, lambda: create_http_client(keepalive_expiry))
+
+
+@dataclass
+class PreparedQuestion:
+    """A routed and encoded question waiting to be sent."""
+    question: str
+    user_message: dict
+    route: RouteDecision
+    session_version: int
+    profile: Optional[object] = None
+    # Seconds per stage, plus the screenshot itself when the session is recorded
+    timings: Dict[str, float] = field(default_factory=dict)
+    screenshot: Optional[object] = None
+    # Id of the question on the assistant daemon when prepared remotely
+    handle: Optional[str] = None
+    # Same message with the screenshot inline when user_message references an
+    # uploaded file: kept in the history, and sent if the API rejects the file
+    inline_message: Optional[dict] = None
+    # Latency operating point the screenshot was encoded and sent at; None for
+    # text-only requests and for a detail level the point does not prescribe
+    point: Optional[object] = None
+
 
 class ScreenAssistantCore:
     """Core functionality for screen capture and GPT interaction."""
     
-    def __init__(self):
-        """Initialize the assistant with API client."""
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY is required")
-        
-        # Configure SSL verification
-        disable_ssl = os.getenv("DISABLE_SSL_VERIFY", "false").lower() == "true"
-        http_client = httpx.Client(verify=not disable_ssl)
+    def __init__(self, client: Optional[OpenAI] = None, helpers: bool = True):
+        """
+        Initialize the assistant with API client.
         
-        self.client = OpenAI(api_key=api_key, http_client=http_client)
+        Args:
+            client: OpenAI client (created from the environment if not given)
+            helpers: Set up watch mode and the capture worker when enabled in the
+                     environment; False for cores that never capture themselves
+        """
+        self.client = client or create_client()
         self.model = "gpt-4o"
-        # Initialize conversation history
+        self.capture_settings = CaptureSettings.from_env()
+        # Initialize conversation history; the lock guards it together with the
+        # session version, which is bumped on reset so stale answers are dropped
+        self._history_lock = threading.Lock()
+        self._session_version = 0
+        self._pending = set()
         self.conversation_history = [
             {
                 "role": "system",
                 "content": "You are a helpful assistant that can see the user's screen. Analyze the screenshot and provide helpful, accurate answers to the user's questions. Be specific and actionable in your responses. Maintain context from previous interactions in the conversation."
             }
         ]
+        
+        # Optional watch mode (WATCH_MODE=true): recent keyframes are attached to questions
+        self.watcher = watcher_from_env(self.capture_watch_sample) if helpers else None
+        self.watch_attach_frames = int(os.getenv("WATCH_ATTACH_FRAMES", "3"))
+        
+        # Older turns are summarized in the background once the history grows, and
+        # only the most recent screenshots are kept in it
+        self.compactor = ConversationCompactor.from_env(self.client)
+        self.max_history_images = int(os.getenv("HISTORY_MAX_IMAGES", "3"))
+        
+        # Per-question choice of image detail, model and max_tokens
+        self.router = RequestRouter.from_env(self.model, max_tokens=1500)
+        self._last_signature = None
+        
+        # Replaced by a QuestionProfiler when started with --profile
+        self.profiler = NullProfiler()
+        
+        # Set to a SessionRecorder when started with --record
+        self.recorder = None
+        
+        # Optional latency target (LATENCY_TARGET): screenshot size, quality and
+        # detail are adjusted to keep the time until the answer starts near it
+        self.latency = LatencyController.from_env()
+        
+        # Optional background upload (PREUPLOAD=true): the screenshot taken when the
+        # window opens is uploaded while the question is typed and sent by reference
+        self.uploader = ImageUploader.from_env(self.client) if helpers else None
+        
+        # Optional hedging (HEDGE=true): a duplicate request is sent when the first
+        # token is later than usual, and the slower of the two is cancelled
+        self.hedging = HedgePolicy.from_env()
+        
+        # Optional worker process (CAPTURE_WORKER=true) that captures and encodes
+        # screenshots off the UI process
+        self.capture_worker = None
+        if helpers and os.getenv("CAPTURE_WORKER", "false").lower() == "true":
+            self.capture_worker = CaptureWorker()
+            self.capture_worker.start()
+    
+    def start_watching(self, should_sample=None):
+        """Start background screen sampling if watch mode is enabled."""
+        if self.watcher:
+            self.watcher.should_sample = should_sample
+            self.watcher.start()
+    
+    def stop_watching(self):
+        """Stop background screen sampling."""
+        if self.watcher:
+            self.watcher.stop()
     
-    def capture_screen(self) -> Optional[Image.Image]:
-        """Capture a screenshot of the entire screen."""
+    def capture_screen(self, settings: Optional[CaptureSettings] = None) -> Optional[Image.Image]:
+        """Capture a screenshot of the given or configured capture area."""
         try:
             with mss.mss() as sct:
-                monitor = sct.monitors[1]  # Primary monitor
+                monitor = (settings or self.capture_settings).resolve(sct.monitors)
                 screenshot = sct.grab(monitor)
                 img = Image.frombytes("RGB", screenshot.size, screenshot.bgra, "raw", "BGRX")
                 return img
@@ -60,71 +187,457 @@ class ScreenAssistantCore:
             print(f"Error capturing screen: {e}")
             return None
     
-    def image_to_base64(self, image: Image.Image) -> str:
-        """Convert PIL Image to base64 string."""
+    def capture_watch_sample(self) -> Optional[Union[Image.Image, EncodedFrame]]:
+        """Capture a watch mode sample, in the worker process if enabled."""
+        if self.capture_worker:
+            # Compared with the last keyframe there and only encoded if it changed
+            return self.capture_worker.capture(
+                self.capture_settings,
+                quality=self.watcher.keyframe_quality,
+                max_side=self.watcher.keyframe_max_side,
+                unchanged_from=self.watcher.last_signature,
+                threshold=self.watcher.change_threshold,
+            )
+        return self.capture_screen()
+    
+    def capture_for_question(self, settings: Optional[CaptureSettings] = None
+                             ) -> Optional[Union[Image.Image, EncodedFrame]]:
+        """Capture the screen for a question, encoded by the worker process if enabled."""
+        if self.capture_worker:
+            point = self.latency.point if self.latency else None
+            frame = self.capture_worker.capture(
+                settings or self.capture_settings,
+                quality=point.quality if point else 85,
+                max_side=point.max_side if point else None,
+            )
+            if frame:
+                frame.point = point
+            return frame
+        return self.capture_screen(settings)
+    
+    def start_recording(self, path: str) -> SessionRecorder:
+        """Record every turn of this session to a replayable archive at path."""
+        self.recorder = SessionRecorder(path, {
+            "model": self.model,
+            "capture_mode": self.capture_settings.describe(),
+            "capture_worker": self.capture_worker is not None,
+            "router": self.router.enabled,
+            "fast_model": self.router.fast_model,
+            "watch_mode": self.watcher is not None,
+            "history_max_images": self.max_history_images,
+            "compact_turns": self.compactor.max_turns if self.compactor else 0,
+        })
+        return self.recorder
+    
+    def close(self):
+        """Stop background helpers."""
+        self.stop_watching()
+        if self.capture_worker:
+            self.capture_worker.stop()
+        if self.recorder:
+            self.recorder.close()
+        if self.uploader:
+            self.uploader.close()
+    
+    def preupload(self, screenshot: Union[Image.Image, EncodedFrame]) -> Optional[PreUploadedImage]:
+        """Start uploading a screenshot ahead of the question; None if pre-upload is off."""
+        if not self.uploader:
+            return None
+        point = self.latency.point if self.latency else None
+        if point:
+            uploaded = self.uploader.start(screenshot, point.quality, point.max_side)
+            # Frames from the capture worker are uploaded as encoded
+            uploaded.point = screenshot.point if isinstance(screenshot, EncodedFrame) else point
+            return uploaded
+        return self.uploader.start(screenshot)
+    
+    def image_to_base64(self, image: Image.Image, quality: int = 85, max_side: Optional[int] = None) -> str:
+        """Convert PIL Image to base64 string, optionally downscaled to max_side."""
         buffered = io.BytesIO()
+        image = scale_to(image, max_side)
         if image.mode != "RGB":
             image = image.convert("RGB")
-        image.save(buffered, format="JPEG", quality=85)
+        image.save(buffered, format="JPEG", quality=quality)
         img_str = base64.b64encode(buffered.getvalue()).decode()
         return img_str
     
-    def ask_gpt(self, question: str, screenshot: Image.Image) -> Optional[str]:
-        """Send question and screenshot to GPT-4 Vision API with conversation history."""
+    @contextmanager
+    def stage(self, timings: Dict[str, float], profile, name: str, cpu: bool = True):
+        """Time a stage for the session record and profile it if profiling is on."""
+        started = time.perf_counter()
         try:
-            base64_image = self.image_to_base64(screenshot)
+            with self.profiler.stage(profile, name, cpu):
+                yield
+        finally:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+    
+    @property
+    def session_version(self) -> int:
+        """Counter bumped on every reset; work tagged with an older value is stale."""
+        with self._history_lock:
+            return self._session_version
+    
+    def prepare_question(self, question: str,
+                         screenshot: Union[Image.Image, EncodedFrame, PreUploadedImage],
+                         session_version: Optional[int] = None,
+                         has_history: Optional[bool] = None,
+                         profile=None,
+                         timings: Optional[Dict[str, float]] = None) -> PreparedQuestion:
+        """
+        Route and encode a question so it is ready to send.
+        
+        Args:
+            question: User's question
+            screenshot: Screenshot taken when the question was asked, raw, already
+                        encoded or already uploaded
+            session_version: Session the question belongs to (defaults to the current one)
+            has_history: Whether earlier turns precede it (defaults to checking the history)
+            profile: Profiling handle for the question, if profiling is on
+            timings: Stage timings measured so far (e.g. capture)
+        """
+        timings = dict(timings or {})
+        with self._history_lock:
+            if session_version is None:
+                session_version = self._session_version
+            if has_history is None:
+                has_history = len(self.conversation_history) > 1
+        
+        # Route the question: text-only, low or high detail, and which model
+        uploaded = screenshot if isinstance(screenshot, PreUploadedImage) else None
+        encoded = isinstance(screenshot, EncodedFrame)
+        with self.stage(timings, profile, "build"):
+            signature = screenshot.signature if encoded or uploaded else frame_signature(screenshot)
+            screen_changed = frame_difference(signature, self._last_signature) >= SCREEN_CHANGE_THRESHOLD
+            self._last_signature = signature
+            route = self.router.route(question, screen_changed, has_history)
+            point = self.latency.point if self.latency else None
+            if point and route.detail == "high" and point.detail == "low":
+                route = RouteDecision("low", route.model, route.max_tokens, route.reason + ", latency target")
+        
+        base64_image = None
+        file_id = None
+        encoded_at = point
+        if route.detail and uploaded:
+            # Usually finished while the question was typed
+            with self.stage(timings, profile, "encode"):
+                base64_image, file_id = uploaded.result()
+            encoded_at = uploaded.point
+        elif route.detail and encoded:
+            base64_image = screenshot.base64
+            # Encoded in the worker process, as part of the capture
+            timings["encode"] = screenshot.encode_time
+            encoded_at = screenshot.point
+        elif route.detail:
+            with self.stage(timings, profile, "encode"):
+                if point:
+                    base64_image = self.image_to_base64(screenshot, point.quality, point.max_side)
+                else:
+                    base64_image = self.image_to_base64(screenshot)
+        # Only requests sending the screenshot as the operating point prescribes
+        # tell the latency controller anything about that point
+        if not (point and base64_image and encoded_at == point and route.detail == point.detail):
+            encoded_at = None
+        
+        with self.stage(timings, profile, "build"):
+            content = [
+                {
+                    "type": "text",
+                    "text": question
+                }
+            ]
+            if base64_image:
+                # Recent watch-mode keyframes go between the question and the current screen
+                if self.watcher:
+                    keyframes = self.watcher.relevant_frames(
+                        count=self.watch_attach_frames, current_signature=signature
+                    )
+                    content.extend(keyframe_content(keyframes))
+                
+                content.append({
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:image/jpeg;base64,{base64_image}",
+                        "detail": route.detail
+                    }
+                })
             
-            # Add current user message with screenshot to history
             user_message = {
                 "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": question
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}",
-                            "detail": "high"
-                        }
-                    }
-                ]
+                "content": content
             }
             
-            # Add user message to history
-            self.conversation_history.append(user_message)
+            # The request references the uploaded file; the history keeps it inline
+            inline_message = None
+            if uploaded:
+                if file_id and base64_image:
+                    uploaded.used = True
+                    inline_message = user_message
+                    user_message = {"role": "user", "content": content[:-1] + [file_part(file_id, route.detail)]}
+                else:
+                    uploaded.discard()
+        
+        record = screenshot if self.recorder else None
+        if self.recorder and uploaded:
+            record = EncodedFrame(uploaded.result()[0], uploaded.size, uploaded.signature)
+        return PreparedQuestion(
+            question, user_message, route, session_version, profile, timings, record,
+            inline_message=inline_message, point=encoded_at
+        )
+    
+    def send_prepared(self, prepared: PreparedQuestion,
+                      cancel_token: Optional[CancelToken] = None,
+                      on_delta: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """
+        Send a prepared question with the conversation history.
+        
+        The turn is only added to the history if the request completes without
+        being cancelled and its session was not reset in the meantime.
+        
+        Args:
+            prepared: Question returned by prepare_question
+            cancel_token: Token to cancel the request with
+            on_delta: Optional callback receiving the answer text as it streams in
+        """
+        token = cancel_token or CancelToken()
+        with self._history_lock:
+            if prepared.session_version != self._session_version:
+                return None
+            self._pending.add(token)
+            messages = self.conversation_history + [prepared.user_message]
+        timings = prepared.timings
+        assistant_response = None
+        status = "error"
+        try:
+            route = prepared.route
+            
+            def on_text(text):
+                if "ttft" not in timings:
+                    timings["ttft"] = time.perf_counter() - started
+                if on_delta:
+                    on_delta(text)
+            
+            def complete(messages):
+                # Uploaded screenshots can only be referenced through the Responses API
+                request = stream_response if referenced_files(messages) else stream_completion
+                arguments = dict(
+                    on_delta=on_text,
+                    model=route.model,
+                    messages=messages,
+                    max_tokens=route.max_tokens,
+                    temperature=0.7
+                )
+                if self.hedging:
+                    return self.hedging.complete(self.client, token, request=request, **arguments)
+                return request(self.client, token, **arguments)
             
             # Send full conversation history to GPT
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=self.conversation_history,
-                max_tokens=1500,
-                temperature=0.7
-            )
+            started = time.perf_counter()
+            try:
+                with self.stage(timings, prepared.profile, "request", cpu=False), measure_upload() as upload:
+                    try:
+                        assistant_response = complete(messages)
+                    except BadRequestError as e:
+                        uploaded = referenced_files([prepared.user_message])
+                        if not prepared.inline_message or not file_rejected(e, uploaded):
+                            raise
+                        # The endpoint does not take the uploaded image; send this one
+                        # inline and stop uploading
+                        print(f"Uploaded screenshot rejected, sending screenshots inline: {e}")
+                        self.uploader.enabled = False
+                        for file_id in uploaded:
+                            self.uploader.delete(file_id)
+                        prepared.user_message, prepared.inline_message = prepared.inline_message, None
+                        messages = messages[:-1] + [prepared.user_message]
+                        assistant_response = complete(messages)
+            except Exception:
+                self.router.record(prepared.question, route, time.perf_counter() - started, ok=False)
+                raise
+            self.router.record(prepared.question, route, time.perf_counter() - started, ok=True)
+            if "upload" in upload:
+                timings["upload"] = upload["upload"]
+            if self.latency and "ttft" in timings:
+                self.latency.observe(
+                    prepared.point,
+                    timings.get("build", 0.0) + timings.get("encode", 0.0) + timings["ttft"],
+                    upload.get("upload"), upload.get("bytes")
+                )
             
-            assistant_response = response.choices[0].message.content
+            # Add the completed turn to history unless it went stale
+            with self._history_lock:
+                if token.cancelled or prepared.session_version != self._session_version:
+                    status = "cancelled"
+                    return None
+                status = "ok"
+                self.conversation_history.append(prepared.inline_message or prepared.user_message)
+                self.conversation_history.append({
+                    "role": "assistant",
+                    "content": assistant_response
+                })
+                prune_images(self.conversation_history, self.max_history_images)
             
-            # Add assistant response to history
-            self.conversation_history.append({
-                "role": "assistant",
-                "content": assistant_response
-            })
+            # Fold old turns into a summary before the next question arrives
+            if self.compactor:
+                self.compactor.maybe_compact(lambda: self.conversation_history, self._history_lock)
             
             return assistant_response
             
+        except RequestCancelled:
+            status = "cancelled"
+            return None
         except Exception as e:
             print(f"Error communicating with GPT: {e}")
             return None
+        finally:
+            with self._history_lock:
+                self._pending.discard(token)
+            # An uploaded screenshot serves a single request
+            if self.uploader:
+                for file_id in referenced_files([prepared.user_message]):
+                    self.uploader.delete(file_id)
+            if self.recorder:
+                self.recorder.record_turn(
+                    prepared.question, prepared.screenshot, prepared.route, prepared.session_version,
+                    timings, messages, assistant_response, status
+                )
+    
+    def ask_gpt(self, question: str, screenshot: Union[Image.Image, EncodedFrame],
+                cancel_token: Optional[CancelToken] = None,
+                on_delta: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """Send question and screenshot to GPT-4 Vision API with conversation history."""
+        try:
+            prepared = self.prepare_question(question, screenshot)
+        except Exception as e:
+            print(f"Error preparing request: {e}")
+            return None
+        return self.send_prepared(prepared, cancel_token, on_delta)
+    
+    def cancel_pending(self):
+        """Cancel all in-flight requests; their answers are discarded."""
+        with self._history_lock:
+            pending = list(self._pending)
+        for token in pending:
+            token.cancel()
     
     def reset_conversation(self):
-        """Reset the conversation history."""
-        self.conversation_history = [
-            {
-                "role": "system",
-                "content": "You are a helpful assistant that can see the user's screen. Analyze the screenshot and provide helpful, accurate answers to the user's questions. Be specific and actionable in your responses. Maintain context from previous interactions in the conversation."
-            }
-        ]
+        """Reset the conversation history and cancel requests for the old session."""
+        self.cancel_pending()
+        if self.recorder:
+            self.recorder.record_reset()
+        with self._history_lock:
+            self._session_version += 1
+            self.conversation_history = [
+                {
+                    "role": "system",
+                    "content": "You are a helpful assistant that can see the user's screen. Analyze the screenshot and provide helpful, accurate answers to the user's questions. Be specific and actionable in your responses. Maintain context from previous interactions in the conversation."
+                }
+            ]
+            self._last_signature = None
+
+
+class RemoteAssistantCore:
+    """
+    Stand-in for ScreenAssistantCore that forwards to a running assistant daemon.
+    
+    The daemon captures, encodes and sends; the conversation lives there and
+    survives restarting the GUI.
+    """
+    
+    def __init__(self, daemon: DaemonClient):
+        self.daemon = daemon
+        self.daemon.call("status")
+        self.capture_settings = CaptureSettings.from_env()
+        self.profiler = NullProfiler()
+        self.watcher = None
+        self.latency = None  # tuned by the daemon
+        self.uploader = None
+        self.hedging = None
+    
+    stage = ScreenAssistantCore.stage
+    
+    def start_watching(self, should_sample=None):
+        """Watch mode runs in the daemon process, if at all."""
+    
+    def close(self):
+        """Nothing to stop; the daemon keeps running."""
+    
+    @property
+    def session_version(self) -> int:
+        return self.daemon.call("status")["session_version"]
+    
+    def capture_watch_sample(self) -> Optional[Union[Image.Image, EncodedFrame]]:
+        """Capture a watch mode sample, in the worker process if enabled."""
+        if self.capture_worker:
+            # Compared with the last keyframe there and only encoded if it changed
+            return self.capture_worker.capture(
+                self.capture_settings,
+                quality=self.watcher.keyframe_quality,
+                max_side=self.watcher.keyframe_max_side,
+                unchanged_from=self.watcher.last_signature,
+                threshold=self.watcher.change_threshold,
+            )
+        return self.capture_screen()
+    
+    def capture_for_question(self, settings: Optional[CaptureSettings] = None) -> Optional[str]:
+        """Have the daemon capture the screen; returns the id of the frame it holds."""
+        settings = settings or self.capture_settings
+        try:
+            reply = self.daemon.call("capture", settings={
+                "mode": settings.mode,
+                "region": settings.region,
+                "window": settings.window,
+                "exclude": list(settings.exclude),
+            })
+        except DaemonError as e:
+            print(f"Error capturing screen: {e}")
+            return None
+        return reply["frame"]
+    
+    def prepare_question(self, question: str, screenshot: str,
+                         session_version: Optional[int] = None,
+                         has_history: Optional[bool] = None,
+                         profile=None,
+                         timings: Optional[Dict[str, float]] = None) -> PreparedQuestion:
+        """Route and encode a question on the daemon."""
+        timings = dict(timings or {})
+        with self.stage(timings, profile, "build"):
+            reply = self.daemon.call(
+                "prepare", question=question, frame=screenshot,
+                session_version=session_version, has_history=has_history
+            )
+        return PreparedQuestion(
+            question, {}, RouteDecision(**reply["route"]), reply["session_version"], profile, timings,
+            handle=reply["prepared"]
+        )
+    
+    def send_prepared(self, prepared: PreparedQuestion,
+                      cancel_token: Optional[CancelToken] = None,
+                      on_delta: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """Send a question prepared on the daemon; cancelling closes the connection."""
+        token = cancel_token or CancelToken()
+        reply = None
+        try:
+            with self.stage(prepared.timings, prepared.profile, "request", cpu=False):
+                stream = self.daemon.stream("send", prepared=prepared.handle)
+                token.attach(stream)
+                for reply in stream:
+                    if "delta" in reply and on_delta:
+                        on_delta(reply["delta"])
+        except RequestCancelled:
+            return None
+        except DaemonError as e:
+            print(f"Error communicating with the assistant daemon: {e}")
+            return None
+        if token.cancelled or not reply or not reply.get("ok"):
+            if reply and not reply.get("ok") and not reply.get("cancelled"):
+                print(f"Error communicating with GPT: {reply.get('error')}")
+            return None
+        return reply["answer"]
+    
+    def cancel_pending(self):
+        self.daemon.call("cancel")
+    
+    def reset_conversation(self):
+        self.daemon.call("reset")
 
 
 class SpotlightWindow:
@@ -138,6 +651,23 @@ class SpotlightWindow:
         self.status_label = None
         self.is_visible = False
         
+        # Question pipeline: each question is captured and encoded at submit time,
+        # then sent in order as earlier answers complete. Escape bumps the epoch so
+        # everything queued before it is dropped.
+        self.capture_queue = queue.Queue()
+        self.request_queue = queue.Queue()
+        self.queued = 0
+        self.epoch = 0
+        self._queue_lock = threading.Lock()
+        # Screenshot taken as the window opened, uploading while the question is typed;
+        # the generation changes whenever a pre-upload still in progress must not be used
+        self.preuploaded = None
+        self.preupload_generation = 0
+        # Window that had focus before the assistant opened, for window capture mode
+        self.target_window = None
+        threading.Thread(target=self._capture_worker, daemon=True).start()
+        threading.Thread(target=self._request_worker, daemon=True).start()
+        
     def create_window(self):
         """Create the Spotlight-like window."""
         self.root = tk.Tk()
@@ -273,6 +803,24 @@ class SpotlightWindow:
         )
         self.reset_button.pack(side=tk.RIGHT, padx=(10, 0))
         
+        # Capture area button: drag out a rectangle, or go back to the default area
+        self.area_button = tk.Button(
+            status_frame,
+            text="Select Area",
+            font=("SF Pro Display", 10),
+            bg="#555555",
+            fg=text_color,
+            activebackground="#666666",
+            activeforeground=text_color,
+            relief=tk.FLAT,
+            padx=12,
+            pady=6,
+            cursor="hand2",
+            command=self.toggle_capture_area
+        )
+        self.area_button.pack(side=tk.RIGHT, padx=(10, 0))
+        self.default_capture_settings = self.assistant.capture_settings
+        
         # Result area (scrollable)
         result_frame = tk.Frame(main_frame, bg=bg_color)
         result_frame.pack(fill=tk.BOTH, expand=True)
@@ -315,6 +863,14 @@ class SpotlightWindow:
         if not self.root:
             self.create_window()
         
+        # Remember the window the question will be about before taking focus
+        if not self.is_visible and self.assistant.capture_settings.mode == "window":
+            self.target_window = active_window(self._own_windows())
+        
+        # With pre-upload on, capture the screen before the window covers it
+        if self.assistant.uploader and not self.is_visible:
+            self._start_preupload()
+        
         self.root.deiconify()
         self.root.lift()
         self.root.focus_force()
@@ -336,6 +892,20 @@ class SpotlightWindow:
         
         self.is_visible = True
     
+    def _own_windows(self) -> tuple:
+        """Ids of the assistant's own top-level window, never a capture target."""
+        try:
+            return int(self.root.wm_frame(), 16), self.root.winfo_id()
+        except (tk.TclError, ValueError):
+            return ()
+    
+    def _capture_settings(self) -> CaptureSettings:
+        """Capture settings for a question; window mode targets the remembered window."""
+        settings = self.assistant.capture_settings
+        if settings.mode != "window":
+            return settings
+        return replace(settings, window=self.target_window, exclude=self._own_windows())
+    
     def _focus_input(self):
         """Helper method to focus input after window is shown."""
         try:
@@ -355,10 +925,61 @@ class SpotlightWindow:
             print(f"Focus error: {e}")
     
     def hide_window(self, event):
-        """Hide the window."""
+        """Hide the window; pressing Escape also cancels the request in flight."""
+        if event is not None:
+            with self._queue_lock:
+                self.epoch += 1
+            self.assistant.cancel_pending()
         if self.root:
             self.root.withdraw()
             self.is_visible = False
+        self._discard_preupload()
+    
+    def _start_preupload(self):
+        """
+        Capture and pre-upload the screen on a background thread.
+        
+        The window is shown once the capture is done, or after
+        PREUPLOAD_CAPTURE_WAIT if the capture is slow; a capture that ends
+        after that may contain the window and is dropped, so the question
+        captures the screen itself.
+        """
+        self._discard_preupload()
+        generation = self.preupload_generation
+        settings = self._capture_settings()
+        lock = threading.Lock()
+        captured = threading.Event()
+        shown = []
+        
+        def work():
+            screenshot = self.assistant.capture_for_question(settings)
+            with lock:
+                covered = bool(shown)
+                captured.set()
+            if not screenshot or covered:
+                return
+            preuploaded = self.assistant.preupload(screenshot)
+            if preuploaded:
+                self.root.after(0, lambda: self._keep_preupload(generation, preuploaded))
+        
+        threading.Thread(target=work, daemon=True).start()
+        captured.wait(PREUPLOAD_CAPTURE_WAIT)
+        with lock:
+            shown.append(True)
+    
+    def _keep_preupload(self, generation: int, preuploaded: PreUploadedImage):
+        """Use a finished pre-upload unless the window was closed or a question was asked meanwhile."""
+        if generation == self.preupload_generation and self.is_visible:
+            self.preuploaded = preuploaded
+        else:
+            preuploaded.discard()
+    
+    def _discard_preupload(self):
+        """Drop the pre-uploaded screenshot if no question used it."""
+        self.preupload_generation += 1
+        if self.preuploaded:
+            self.preuploaded.discard()
+            self.preuploaded = None
     
     def toggle_window(self):
         """Toggle window visibility."""
@@ -410,71 +1031,205 @@ class SpotlightWindow:
         # Clear status after 2 seconds
         self.root.after(2000, lambda: self.status_label.config(text=""))
     
+    def toggle_capture_area(self):
+        """Select a capture rectangle, or clear the one currently selected."""
+        if self.assistant.capture_settings.mode == "region" and self.default_capture_settings.mode != "region":
+            self.assistant.capture_settings = self.default_capture_settings
+            self.area_button.config(text="Select Area")
+            self.update_status(f"📐 Capturing: {self.assistant.capture_settings.describe()}")
+            return
+        self.select_region()
+    
+    def select_region(self):
+        """Let the user drag a rectangle on a translucent full-screen overlay."""
+        self.root.withdraw()
+        overlay = tk.Toplevel(self.root)
+        overlay.attributes("-fullscreen", True)
+        overlay.attributes("-topmost", True)
+        overlay.attributes("-alpha", 0.3)
+        canvas = tk.Canvas(overlay, bg="black", cursor="crosshair", highlightthickness=0)
+        canvas.pack(fill=tk.BOTH, expand=True)
+        state = {}
+        
+        def on_press(event):
+            state["start"] = (event.x_root, event.y_root)
+            state["origin"] = (event.x, event.y)
+            state["rect"] = canvas.create_rectangle(event.x, event.y, event.x, event.y, outline="#007AFF", width=2)
+        
+        def on_drag(event):
+            if "rect" in state:
+                x0, y0 = state["origin"]
+                canvas.coords(state["rect"], x0, y0, event.x, event.y)
+        
+        def finish(region):
+            overlay.destroy()
+            self.root.deiconify()
+            self.root.lift()
+            if region:
+                self.assistant.capture_settings = CaptureSettings("region", region)
+                self.area_button.config(text="Full Area")
+            self.update_status(f"📐 Capturing: {self.assistant.capture_settings.describe()}")
+            self.root.after(10, self._focus_input)
+        
+        def on_release(event):
+            if "start" not in state:
+                return
+            x0, y0 = state["start"]
+            left, top = min(x0, event.x_root), min(y0, event.y_root)
+            width, height = abs(event.x_root - x0), abs(event.y_root - y0)
+            finish((left, top, width, height) if width >= 16 and height >= 16 else None)
+        
+        def on_escape(event):
+            finish(None)
+            return "break"  # don't let the global Escape binding cancel requests
+        
+        canvas.bind("<ButtonPress-1>", on_press)
+        canvas.bind("<B1-Motion>", on_drag)
+        canvas.bind("<ButtonRelease-1>", on_release)
+        overlay.bind("<Escape>", on_escape)
+        overlay.focus_force()
+    
     def on_submit(self, event):
-        """Handle question submission."""
+        """Handle question submission; input stays enabled for the next question."""
         question = self.input_entry.get().strip()
         
         # Check for placeholder or empty
         if self.placeholder_active or question == self.placeholder or not question:
             return
         
-        # Disable input during processing
-        self.input_entry.config(state=tk.DISABLED)
-        self.update_status("📸 Capturing screen...")
-        
-        # Run in separate thread to avoid blocking UI
-        thread = threading.Thread(target=self.process_question, args=(question,))
-        thread.daemon = True
-        thread.start()
+        self.input_entry.delete(0, tk.END)
+        profile = self.assistant.profiler.begin(question)
+        # Only the first question after opening the window uses the pre-uploaded screen
+        preuploaded, self.preuploaded = self.preuploaded, None
+        self.preupload_generation += 1
+        with self._queue_lock:
+            earlier = self.queued > 0
+            self.queued += 1
+            item = (question, self.assistant.session_version, self.epoch, earlier, profile, preuploaded)
+        self.update_status(self._queue_status("📤 Preparing question..." if preuploaded else "📸 Capturing screen..."))
+        self.capture_queue.put(item)
     
-    def process_question(self, question: str):
-        """Process question in background thread."""
-        import time
-        
+    def _queue_status(self, message: str) -> str:
+        """Append the number of questions waiting behind the current one."""
+        waiting = self.queued - 1
+        return f"{message} ({waiting} more queued)" if waiting > 0 else message
+    
+    def _finish_question(self):
+        with self._queue_lock:
+            self.queued -= 1
+    
+    def _is_stale(self, epoch: int) -> bool:
+        with self._queue_lock:
+            return epoch != self.epoch
+    
+    def _capture_worker(self):
+        """Capture and encode queued questions in submit order."""
+        while True:
+            question, version, epoch, earlier, profile, preuploaded = self.capture_queue.get()
+            prepared = None
+            try:
+                if not self._is_stale(epoch):
+                    prepared = self.capture_question(question, version, earlier, profile, preuploaded)
+            except Exception as e:
+                self.root.after(0, lambda e=e: self.update_status(f"❌ Error: {str(e)}"))
+            if prepared is None:
+                if preuploaded:
+                    preuploaded.discard()
+                self.assistant.profiler.finish(profile)
+                self._finish_question()
+                continue
+            self.request_queue.put((epoch, prepared))
+    
+    def capture_question(self, question: str, version: int, earlier: bool,
+                         profile=None, preuploaded: Optional[PreUploadedImage] = None
+                         ) -> Optional[PreparedQuestion]:
+        """Capture the screen for a question (unless it was captured on opening) and prepare its request."""
+        timings = {}
+        if preuploaded:
+            return self.assistant.prepare_question(
+                question, preuploaded, session_version=version, has_history=True if earlier else None,
+                profile=profile, timings=timings
+            )
         try:
             # Hide window before capturing screenshot
             self.root.after(0, lambda: self.root.withdraw())
-            self.root.after(0, lambda: self.update_status("📸 Hiding window and capturing screen..."))
             
             # Wait a moment for window to fully hide and screen to update
             time.sleep(0.3)
             
             # Capture screen (now without the GUI window)
-            screenshot = self.assistant.capture_screen()
-            
+            with self.assistant.stage(timings, profile, "capture"):
+                screenshot = self.assistant.capture_for_question(self._capture_settings())
+        finally:
             # Show window again immediately after capture
             self.root.after(0, lambda: self.root.deiconify())
             self.root.after(0, lambda: self.root.lift())
             self.root.after(0, lambda: self.root.focus_force())
-            
-            if not screenshot:
-                self.root.after(0, lambda: self.update_status("❌ Failed to capture screen"))
-                self.root.after(0, lambda: self.input_entry.config(state=tk.NORMAL))
-                return
-            
-            self.root.after(0, lambda: self.update_status("🤖 Sending to GPT (with conversation history)..."))
-            
-            # Ask GPT (conversation history is maintained automatically)
-            response = self.assistant.ask_gpt(question, screenshot)
-            
-            if response:
-                self.root.after(0, lambda: self.update_status("✅ Response received"))
-                # Display result with question for context
-                self.root.after(0, lambda: self.display_result(response, question))
-            else:
-                self.root.after(0, lambda: self.update_status("❌ Failed to get response"))
-            
-        except Exception as e:
-            self.root.after(0, lambda: self.update_status(f"❌ Error: {str(e)}"))
-            # Make sure window is shown even on error
-            self.root.after(0, lambda: self.root.deiconify())
-            self.root.after(0, lambda: self.root.lift())
-        finally:
-            self.root.after(0, lambda: self.input_entry.config(state=tk.NORMAL))
             self.root.after(0, lambda: self.input_entry.focus_set())
-            # Ensure window is visible
-            self.root.after(0, lambda: self.root.deiconify())
-            self.root.after(0, lambda: self.root.lift())
+        
+        if not screenshot:
+            self.root.after(0, lambda: self.update_status("❌ Failed to capture screen"))
+            return None
+        
+        # Encoding overlaps with the generation of the previous answer
+        return self.assistant.prepare_question(
+            question, screenshot, session_version=version, has_history=True if earlier else None,
+            profile=profile, timings=timings
+        )
+    
+    def _request_worker(self):
+        """Send prepared questions one at a time and render answers as they land."""
+        while True:
+            epoch, prepared = self.request_queue.get()
+            rendering = False
+            try:
+                if not self._is_stale(epoch):
+                    rendering = self.process_question(prepared)
+            except Exception as e:
+                self.root.after(0, lambda e=e: self.update_status(f"❌ Error: {str(e)}"))
+            finally:
+                if not rendering:
+                    self.assistant.profiler.finish(prepared.profile)
+                self._finish_question()
+    
+    def process_question(self, prepared: PreparedQuestion) -> bool:
+        """
+        Send a prepared question (in the request worker thread) and show the answer.
+        
+        Returns:
+            True if the answer was handed to the main thread for rendering
+        """
+        token = CancelToken()
+        status = self._queue_status("🤖 Sending to GPT (with conversation history)...")
+        self.root.after(0, lambda: self.update_status(status))
+        
+        # Ask GPT (conversation history is maintained automatically)
+        response = self.assistant.send_prepared(prepared, cancel_token=token)
+        
+        if token.cancelled:
+            self.root.after(0, lambda: self.update_status("⏹ Request cancelled"))
+        elif response:
+            status = self._queue_status("✅ Response received")
+            if self.assistant.latency:
+                status += f" · {self.assistant.latency.status()}"
+            if self.assistant.hedging:
+                status += f" · {self.assistant.hedging.status()}"
+            self.root.after(0, lambda: self.update_status(status))
+            # Display result with question for context
+            self.root.after(0, lambda: self.render_result(response, prepared))
+            return True
+        elif prepared.session_version == self.assistant.session_version:
+            self.root.after(0, lambda: self.update_status("❌ Failed to get response"))
+        return False
+    
+    def render_result(self, text: str, prepared: PreparedQuestion):
+        """Display an answer on the main thread and close its profile."""
+        profiler = self.assistant.profiler
+        try:
+            with profiler.stage(prepared.profile, "render"):
+                self.display_result(text, prepared.question)
+        finally:
+            profiler.finish(prepared.profile)
 
 
 class GlobalHotkeyManager:
@@ -543,9 +1298,53 @@ class GlobalHotkeyManager:
 
 def main():
     """Entry point for the GUI application."""
+    parser = argparse.ArgumentParser(description="Screen Context GPT Assistant (GUI)")
+    parser.add_argument(
+        "--profile", nargs="?", const="profiles", metavar="DIR",
+        help="write per-question CPU and allocation reports to DIR (default: ./profiles)"
+    )
+    parser.add_argument("--capture-mode", choices=CAPTURE_MODES, help="which part of the screen to capture")
+    parser.add_argument("--region", metavar="X,Y,W,H", help="rectangle to capture (implies --capture-mode region)")
+    parser.add_argument(
+        "--record", nargs="?", const="sessions", metavar="PATH",
+        help="record the session to PATH (a .zip file or a directory; default: ./sessions) for replay_session.py"
+    )
+    parser.add_argument(
+        "--daemon", nargs="?", const="", metavar="SOCKET",
+        help="use a running screen-assistant-daemon instead of an in-process assistant"
+    )
+    args = parser.parse_args()
+    
+    try:
+        capture_settings = CaptureSettings.from_env(args.capture_mode, args.region)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+    
     try:
-        # Initialize core assistant
-        assistant = ScreenAssistantCore()
+        # Initialize core assistant, or connect to the daemon that holds it
+        if args.daemon is not None:
+            try:
+                assistant = RemoteAssistantCore(DaemonClient(args.daemon or None))
+            except DaemonError as e:
+                print(f"Error: {e}")
+                print("Start it with `screen-assistant-daemon` first.")
+                return
+            if args.record:
+                print("Sessions are recorded by the daemon; pass --record to screen-assistant-daemon instead.")
+                args.record = None
+        else:
+            assistant = ScreenAssistantCore()
+        assistant.capture_settings = capture_settings
+        if args.profile:
+            assistant.profiler = create_profiler(args.profile)
+            print(f"Profiling enabled; reports are written to {args.profile}/")
+        if args.record:
+            path = args.record
+            if not path.endswith(".zip"):
+                path = os.path.join(path, time.strftime("session-%Y%m%d-%H%M%S.zip"))
+            assistant.start_recording(path)
+            print(f"Recording session to {path}")
         
         # Create GUI window
         window = SpotlightWindow(assistant)
@@ -554,6 +1353,11 @@ def main():
         # Show window initially
         window.show_window()
         
+        # Watch mode pauses while the assistant window is on screen
+        assistant.start_watching(lambda: not window.is_visible)
+        if assistant.watcher:
+            print(f"Watch mode enabled (every {assistant.watcher.interval:g}s).")
+        
         # Try to set up global hotkey (may fail without permissions)
         try:
             hotkey_manager = GlobalHotkeyManager(window)
@@ -571,6 +1375,11 @@ def main():
         # Run the GUI main loop
         window.root.mainloop()
         
+        assistant.close()
+        if assistant.watcher:
+            print(assistant.watcher.summary())
+        assistant.profiler.close()
+        
     except ValueError as e:
         print(f"Error: {e}")
         print("Please set OPENAI_API_KEY in your .env file.")
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Session recording for the Screen Context GPT Assistant.
+A recorded session is a zip archive holding each distinct screenshot once,
+one small JSON record per turn (question, route, per-stage timings, payload
+size, answer) and a manifest describing the settings it ran with. The
+replay tool feeds such an archive back through ScreenAssistantCore.
+
+Layout:
+    manifest.json           settings and start time
+    images/<sha1>.png       lossless captures (or .jpg for worker-encoded frames)
+    events/000001.json      one record per turn or reset, in order
+"""
+
+import base64
+import hashlib
+import io
+import json
+import os
+import platform
+import queue
+import threading
+import time
+import zipfile
+from typing import Dict, Iterator, List, Optional, Union
+
+from PIL import Image
+
+from capture_worker import EncodedFrame
+from frame_buffer import frame_signature
+
+ARCHIVE_VERSION = 1
+
+
+def image_key(image: Union[Image.Image, EncodedFrame]) -> str:
+    """Content hash used to store each distinct screenshot once."""
+    if isinstance(image, EncodedFrame):
+        return hashlib.sha1(image.base64.encode("ascii")).hexdigest()
+    return hashlib.sha1(image.tobytes()).hexdigest()
+
+
+class SessionRecorder:
+    """
+    Appends turns to a session archive.
+
+    Images are hashed and compressed, and payload sizes measured, on a
+    background writer thread so recording stays off the question path. The
+    archive is reopened in append mode for every record, so a session that
+    ends abruptly keeps everything written up to that point.
+    """
+
+    def __init__(self, path: str, settings: Optional[dict] = None):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._started = time.time()
+        self._clock = time.perf_counter()
+        self._images = set()
+        self._count = 0
+        self._queue = queue.Queue()
+        manifest = {
+            "version": ARCHIVE_VERSION,
+            "created": self._started,
+            "platform": platform.platform(),
+            "settings": settings or {},
+        }
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr("manifest.json", json.dumps(manifest, indent=2), zipfile.ZIP_DEFLATED)
+        self._thread = threading.Thread(target=self._writer, daemon=True)
+        self._thread.start()
+
+    def _elapsed(self) -> float:
+        return round(time.perf_counter() - self._clock, 4)
+
+    def record_turn(self, question: str, screenshot, route, session_version: int,
+                    timings: Dict[str, float], messages: List[dict],
+                    answer: Optional[str], status: str):
+        """
+        Queue a completed, failed or cancelled turn.
+
+        Args:
+            question: User's question
+            screenshot: Image or EncodedFrame the question was asked about
+            route: RouteDecision the request was sent with
+            session_version: Session the turn belongs to
+            timings: Seconds spent per stage (capture, build, encode, ttft, request)
+            messages: Messages sent upstream; only measured, on the writer thread
+            answer: Answer text, if any
+            status: "ok", "error" or "cancelled"
+        """
+        event = {
+            "type": "turn",
+            "time": self._elapsed(),
+            "session": session_version,
+            "question": question,
+            "route": {
+                "image": route.image,
+                "model": route.model,
+                "max_tokens": route.max_tokens,
+                "reason": route.reason,
+            },
+            "timings": {name: round(seconds, 4) for name, seconds in timings.items()},
+            "history_messages": len(messages),
+            "answer": answer,
+            "status": status,
+        }
+        self._queue.put((event, screenshot, messages))
+
+    def record_reset(self):
+        """Queue a conversation reset."""
+        self._queue.put(({"type": "reset", "time": self._elapsed()}, None, None))
+
+    def close(self):
+        """Flush pending records and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _writer(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            event, screenshot, messages = item
+            try:
+                self._write(event, screenshot, messages)
+            except Exception as e:
+                print(f"Error recording session: {e}")
+
+    def _write(self, event: dict, screenshot, messages: Optional[List[dict]]):
+        entries = []
+        if screenshot is not None:
+            key = image_key(screenshot)
+            event["image"] = key
+            event["image_size"] = list(screenshot.size)
+            if key not in self._images:
+                if isinstance(screenshot, EncodedFrame):
+                    name, data = f"images/{key}.jpg", base64.b64decode(screenshot.base64)
+                else:
+                    buffered = io.BytesIO()
+                    screenshot.save(buffered, format="PNG", compress_level=1)
+                    name, data = f"images/{key}.png", buffered.getvalue()
+                entries.append((name, data, zipfile.ZIP_STORED))
+                self._images.add(key)
+        if messages is not None:
+            # The list is a snapshot taken at send time; history updates replace
+            # message dicts rather than mutating them, so measuring it later is safe
+            event["payload_bytes"] = len(json.dumps(messages))
+        self._count += 1
+        event["index"] = self._count
+        entries.append((f"events/{self._count:06d}.json", json.dumps(event), zipfile.ZIP_DEFLATED))
+        with zipfile.ZipFile(self.path, "a") as archive:
+            for name, data, compression in entries:
+                archive.writestr(name, data, compression)
+
+
+class SessionArchive:
+    """Read access to a recorded session."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._zip = zipfile.ZipFile(path)
+        self.manifest = json.loads(self._zip.read("manifest.json"))
+        if self.manifest.get("version") != ARCHIVE_VERSION:
+            raise ValueError(f"Unsupported session archive version {self.manifest.get('version')!r}")
+        self._names = {}
+        for name in self._zip.namelist():
+            if name.startswith("images/"):
+                key = os.path.splitext(os.path.basename(name))[0]
+                self._names[key] = name
+        self.events = [
+            json.loads(self._zip.read(name))
+            for name in sorted(n for n in self._zip.namelist() if n.startswith("events/"))
+        ]
+
+    @property
+    def turns(self) -> List[dict]:
+        return [event for event in self.events if event["type"] == "turn"]
+
+    def image(self, key: str) -> Union[Image.Image, EncodedFrame]:
+        """Load a stored screenshot; worker-encoded frames come back still encoded."""
+        name = self._names[key]
+        data = self._zip.read(name)
+        if name.endswith(".jpg"):
+            image = Image.open(io.BytesIO(data))
+            return EncodedFrame(base64.b64encode(data).decode("ascii"), image.size, frame_signature(image))
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        return image
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self.events)
+
+    def close(self):
+        self._zip.close()
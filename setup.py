@@ -19,7 +19,24 @@ setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/yourusername/screen-assistant",
-    py_modules=["screen_assistant", "screen_assistant_gui"],
+    py_modules=[
+        "screen_assistant",
+        "screen_assistant_gui",
+        "frame_buffer",
+        "conversation_compactor",
+        "request_router",
+        "request_control",
+        "profiling",
+        "capture_worker",
+        "capture_region",
+        "session_archive",
+        "assistant_client",
+        "assistant_daemon",
+        "api_server",
+        "latency_controller",
+        "image_upload",
+        "request_hedging",
+    ],
     install_requires=[
         "openai>=1.12.0",
         "pillow>=10.0.0",
@@ -47,6 +64,9 @@ setup(
         "console_scripts": [
             "screen-assistant=screen_assistant:main",
             "screen-assistant-gui=screen_assistant_gui:main",
+            "screen-assistant-daemon=assistant_daemon:main",
+            "screen-assistant-client=assistant_client:main",
+            "screen-assistant-server=api_server:main",
         ],
     },
 )
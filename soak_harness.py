@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Long-session soak test for the Screen Context GPT Assistant.
+Drives ScreenAssistantCore through hundreds of turns with synthetic frames
+against a local stub backend, tracks RSS, Python heap, request payload size
+and latency per turn, and fails if any of them keeps growing.
+
+Usage:
+    python soak_harness.py --turns 300
+    python soak_harness.py --turns 500 --stub-ttft 0.05 --csv soak.csv
+"""
+
+import argparse
+import csv
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+
+from PIL import Image, ImageDraw
+
+from replay_session import replay_environment
+from stub_backend import StubBackend, StubReply
+
+QUESTIONS = [
+    "What does the error message in this window say?",
+    "thanks, and what about step 3?",
+    "How do I fix this?",
+    "What app is this?",
+    "ok, what next?",
+    "Which value should I put in the highlighted field?",
+]
+
+
+@dataclass
+class TurnSample:
+    turn: int
+    latency: float
+    payload_bytes: int
+    rss_bytes: int
+    heap_bytes: int
+    history_messages: int
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        # Peak rather than current RSS; kilobytes on Linux, bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def synthetic_frame(turn: int, width: int, height: int) -> Image.Image:
+    """A desktop-like frame that changes from turn to turn."""
+    rng = random.Random(turn)
+    image = Image.new("RGB", (width, height), (30, 30, 36))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x0, y0 = rng.randrange(width - 200), rng.randrange(height - 150)
+        x1, y1 = x0 + rng.randrange(100, 600), y0 + rng.randrange(60, 400)
+        color = tuple(rng.randrange(40, 240) for _ in range(3))
+        draw.rectangle((x0, y0, x1, y1), fill=color, outline=(255, 255, 255))
+        for line in range(0, y1 - y0 - 20, 18):
+            draw.text((x0 + 8, y0 + 6 + line), f"turn {turn} line {line // 18} value={rng.random():.4f}",
+                      fill=(0, 0, 0))
+    return image
+
+
+def median(samples, field, start, end) -> float:
+    return statistics.median(getattr(s, field) for s in samples[start:end])
+
+
+def evaluate(samples, args):
+    """Compare the window after warm-up with the final window; returns failure messages."""
+    window = max(10, len(samples) // 10)
+    base_start = min(args.warmup, max(len(samples) - 2 * window, 0))
+    base = (base_start, base_start + window)
+    final = (len(samples) - window, len(samples))
+
+    rows = []
+    failures = []
+
+    def check(name, base_value, final_value, limit, ok, unit):
+        rows.append((name, base_value, final_value, limit, unit))
+        if not ok:
+            failures.append(f"{name}: {base_value:.2f} -> {final_value:.2f} {unit} (limit {limit})")
+
+    mb = 1024 * 1024
+    rss0, rss1 = median(samples, "rss_bytes", *base) / mb, median(samples, "rss_bytes", *final) / mb
+    check("RSS", rss0, rss1, f"+{args.max_rss_growth_mb} MB", rss1 - rss0 <= args.max_rss_growth_mb, "MB")
+
+    heap0, heap1 = median(samples, "heap_bytes", *base) / mb, median(samples, "heap_bytes", *final) / mb
+    check("Python heap", heap0, heap1, f"+{args.max_heap_growth_mb} MB",
+          heap1 - heap0 <= args.max_heap_growth_mb, "MB")
+
+    kb = 1024
+    pay0, pay1 = median(samples, "payload_bytes", *base) / kb, median(samples, "payload_bytes", *final) / kb
+    check("Payload/request", pay0, pay1, f"x{args.max_payload_growth}",
+          pay1 <= pay0 * args.max_payload_growth, "KB")
+
+    lat0, lat1 = median(samples, "latency", *base), median(samples, "latency", *final)
+    check("Latency/turn", lat0, lat1, f"x{args.max_latency_growth} + {args.latency_slack}s",
+          lat1 <= lat0 * args.max_latency_growth + args.latency_slack, "s")
+
+    print(f"\nTurns {base[0]}-{base[1] - 1} vs {final[0]}-{final[1] - 1} (medians):")
+    print(f"  {'metric':<16}{'baseline':>12}{'final':>12}  limit")
+    for name, v0, v1, limit, unit in rows:
+        print(f"  {name:<16}{v0:>9.2f} {unit:<2}{v1:>9.2f} {unit:<2}  {limit}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test ScreenAssistantCore against a local stub backend")
+    parser.add_argument("--turns", type=int, default=300, help="number of questions to ask")
+    parser.add_argument("--warmup", type=int, default=30, help="turns to skip before the baseline window")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--stub-ttft", type=float, default=0.0, help="stub time to first token (s)")
+    parser.add_argument("--stub-duration", type=float, default=0.0, help="stub streaming duration (s)")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=64.0)
+    parser.add_argument("--max-heap-growth-mb", type=float, default=16.0)
+    parser.add_argument("--max-payload-growth", type=float, default=1.25, help="allowed final/baseline ratio")
+    parser.add_argument("--max-latency-growth", type=float, default=1.5, help="allowed final/baseline ratio")
+    parser.add_argument("--latency-slack", type=float, default=0.05, help="absolute latency slack (s)")
+    parser.add_argument("--csv", help="write per-turn samples to this CSV file")
+    args = parser.parse_args()
+
+    answer = "Click the highlighted button, then confirm the dialog. " * 6
+    backend = StubBackend(lambda body: StubReply(answer, args.stub_ttft, args.stub_duration)).start()
+
+    # Point the client at the stub before the core creates it, with the default
+    # routing and history settings and nothing that adapts to the machine (a
+    # latency target would shrink payloads and hide growth); set before the
+    # import, since load_dotenv() does not override existing variables
+    os.environ["OPENAI_BASE_URL"] = backend.base_url
+    os.environ["OPENAI_API_KEY"] = "stub"
+    os.environ.update(replay_environment({}))
+    from screen_assistant_gui import ScreenAssistantCore
+
+    core = ScreenAssistantCore()
+    tracemalloc.start()
+    samples = []
+    errors = 0
+
+    print(f"Soaking {args.turns} turns against {backend.base_url} ...")
+    try:
+        for turn in range(args.turns):
+            frame = synthetic_frame(turn, args.width, args.height)
+            question = QUESTIONS[turn % len(QUESTIONS)]
+            seen = len(backend.requests)
+
+            started = time.perf_counter()
+            response = core.ask_gpt(question, frame)
+            latency = time.perf_counter() - started
+            del frame
+
+            if response is None:
+                errors += 1
+            # Only the streamed question requests count; background summaries are not streamed
+            payload = sum(r["bytes"] for r in backend.requests[seen:] if r["stream"])
+            with core._history_lock:
+                history_messages = len(core.conversation_history)
+            samples.append(TurnSample(
+                turn, latency, payload, rss_bytes(), tracemalloc.get_traced_memory()[0], history_messages
+            ))
+            if (turn + 1) % 50 == 0:
+                s = samples[-1]
+                print(f"  turn {turn + 1}: {s.latency * 1000:.0f} ms, {s.payload_bytes / 1024:.0f} KB sent, "
+                      f"RSS {s.rss_bytes / 1024 / 1024:.0f} MB, heap {s.heap_bytes / 1024 / 1024:.1f} MB, "
+                      f"{s.history_messages} messages in history")
+    finally:
+        backend.stop()
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(asdict(samples[0]).keys()))
+            writer.writeheader()
+            writer.writerows(asdict(s) for s in samples)
+
+    failures = evaluate(samples, args)
+    if errors:
+        failures.append(f"{errors} request(s) failed")
+    if failures:
+        print("\nFAIL")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("\nPASS")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI chat completions, responses and files endpoints.
+Used by the soak and replay tools to drive the assistant without network
+access or API costs. Point the client at it with OPENAI_BASE_URL.
+
+Like the real API, chat completions reject uploaded images (file parts
+only take PDFs there); the responses endpoint accepts them as
+`input_image` parts with a file id.
+"""
+
+import itertools
+import json
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+
+@dataclass
+class StubReply:
+    """What the stub answers and how long it takes."""
+    text: str
+    ttft: float = 0.0  # seconds before the first token
+    duration: float = 0.0  # seconds from the first token to the last
+
+
+def default_responder(body: dict) -> StubReply:
+    words = ["This", "is", "a", "stub", "answer", "from", "the", "local", "backend."]
+    return StubReply(" ".join(words * 4))
+
+
+CHAT_PART_TYPES = ("text", "image_url", "input_audio", "refusal", "audio", "file")
+
+
+def _invalid(message: str, param: str) -> dict:
+    return {"message": message, "type": "invalid_request_error", "param": param, "code": "invalid_value"}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:
+            pass  # the client dropped the connection of a cancelled request
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        backend = self.server.backend
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            body = json.loads(raw or b"{}")
+            backend.record(self.path, len(raw), body)
+            error = backend.check_chat(body)
+            if error:
+                self._json(400, {"error": error})
+            else:
+                self._completion(body, backend.responder(body))
+        elif self.path.rstrip("/").endswith("/responses"):
+            body = json.loads(raw or b"{}")
+            backend.record(self.path, len(raw), body)
+            error = backend.check_responses(body)
+            if error:
+                self._json(400, {"error": error})
+            else:
+                self._response(body, backend.responder(body))
+        elif self.path.rstrip("/").endswith("/files"):
+            backend.record(self.path, len(raw), None)
+            self._json(200, backend.store_file(raw))
+        else:
+            backend.record(self.path, len(raw), None)
+            self._json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_DELETE(self):
+        backend = self.server.backend
+        backend.record(self.path, 0, None)
+        file_id = self.path.rstrip("/").rsplit("/", 1)[-1]
+        if "/files/" in self.path and backend.delete_file(file_id):
+            self._json(200, {"id": file_id, "object": "file", "deleted": True})
+        else:
+            self._json(404, {"error": {"message": f"No such file {file_id}"}})
+
+    def _json(self, status: int, payload: dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _completion(self, body: dict, reply: StubReply):
+        model = body.get("model", "stub")
+        if not body.get("stream"):
+            time.sleep(reply.ttft + reply.duration)
+            self._json(200, {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": reply.text},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(reply.ttft)
+        pieces = reply.text.split(" ")
+        delay = reply.duration / max(len(pieces), 1)
+        try:
+            for i, piece in enumerate(pieces):
+                text = piece if i == 0 else " " + piece
+                self._event(self._chunk(model, {"content": text}, None))
+                if delay:
+                    time.sleep(delay)
+            self._event(self._chunk(model, {}, "stop"))
+            self._send_chunk(b"data: [DONE]\n\n")
+            self._send_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled the request
+            self.close_connection = True
+
+    def _response(self, body: dict, reply: StubReply):
+        model = body.get("model", "stub")
+        message = {"id": "msg_stub", "type": "message", "role": "assistant", "status": "completed",
+                   "content": [{"type": "output_text", "text": reply.text, "annotations": []}]}
+        response = {"id": "resp_stub", "object": "response", "created_at": int(time.time()),
+                    "model": model, "status": "completed", "output": [message], "error": None}
+        if not body.get("stream"):
+            time.sleep(reply.ttft + reply.duration)
+            self._json(200, response)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        sequence = itertools.count()
+        try:
+            self._event({"type": "response.created", "sequence_number": next(sequence),
+                         "response": {**response, "status": "in_progress", "output": []}},
+                        "response.created")
+            time.sleep(reply.ttft)
+            pieces = reply.text.split(" ")
+            delay = reply.duration / max(len(pieces), 1)
+            for i, piece in enumerate(pieces):
+                self._event({"type": "response.output_text.delta", "sequence_number": next(sequence),
+                             "item_id": "msg_stub", "output_index": 0, "content_index": 0,
+                             "delta": piece if i == 0 else " " + piece}, "response.output_text.delta")
+                if delay:
+                    time.sleep(delay)
+            self._event({"type": "response.completed", "sequence_number": next(sequence),
+                         "response": response}, "response.completed")
+            self._send_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    @staticmethod
+    def _chunk(model: str, delta: dict, finish_reason: Optional[str]) -> dict:
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    def _event(self, payload: dict, name: Optional[str] = None):
+        event = f"event: {name}\n" if name else ""
+        self._send_chunk(f"{event}data: {json.dumps(payload)}\n\n".encode())
+
+    def _send_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+class StubBackend:
+    """Threaded local HTTP server speaking the chat completions protocol."""
+
+    def __init__(self, responder: Callable[[dict], StubReply] = default_responder,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.responder = responder
+        self.requests: List[dict] = []
+        self.files: Dict[str, int] = {}  # uploaded file id -> size of the upload
+        self.file_types: Dict[str, str] = {}  # uploaded file id -> content type
+        self._file_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.backend = self
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def record(self, path: str, nbytes: int, body: Optional[dict]):
+        """Remember the size and model of a request for later inspection."""
+        with self._lock:
+            self.requests.append({
+                "time": time.time(),
+                "path": path,
+                "bytes": nbytes,
+                "model": body.get("model") if body else None,
+                "stream": bool(body.get("stream")) if body else False,
+            })
+
+    def store_file(self, raw: bytes) -> dict:
+        """Keep track of an uploaded file (the content is discarded)."""
+        content_type = "application/octet-stream"
+        if b'name="file"' in raw:
+            headers = raw.split(b'name="file"', 1)[1].split(b"\r\n\r\n", 1)[0]
+            if b"Content-Type:" in headers:
+                content_type = headers.split(b"Content-Type:", 1)[1].split(b"\r\n", 1)[0].strip().decode()
+        with self._lock:
+            file_id = f"file-{next(self._file_ids)}"
+            self.files[file_id] = len(raw)
+            self.file_types[file_id] = content_type
+        purpose = "vision"
+        if b'name="purpose"' in raw:
+            purpose = raw.split(b'name="purpose"', 1)[1].split(b"\r\n\r\n", 1)[1].split(b"\r\n", 1)[0].decode()
+        return {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(raw),
+            "created_at": int(time.time()),
+            "filename": "screen.jpg",
+            "purpose": purpose,
+            "status": "processed",
+        }
+
+    def delete_file(self, file_id: str) -> bool:
+        with self._lock:
+            self.file_types.pop(file_id, None)
+            return self.files.pop(file_id, None) is not None
+
+    def check_chat(self, body: dict) -> Optional[dict]:
+        """The error the real chat completions endpoint returns for the request's content parts, if any."""
+        for i, message in enumerate(body.get("messages", [])):
+            content = message.get("content")
+            for j, part in enumerate(content if isinstance(content, list) else []):
+                kind = part.get("type")
+                if kind not in CHAT_PART_TYPES:
+                    return _invalid(f"Invalid value: '{kind}'. Supported values are: "
+                                    + ", ".join(f"'{t}'" for t in CHAT_PART_TYPES) + ".",
+                                    f"messages[{i}].content[{j}].type")
+                file_id = (part.get("file") or {}).get("file_id") if kind == "file" else None
+                if file_id and self.file_types.get(file_id) != "application/pdf":
+                    return _invalid(f"Invalid file '{file_id}': only PDF files are supported as file inputs.",
+                                    f"messages[{i}].content[{j}].file")
+        return None
+
+    def check_responses(self, body: dict) -> Optional[dict]:
+        """The error for input images referencing files that were never uploaded or were deleted."""
+        for i, item in enumerate(body.get("input", [])):
+            content = item.get("content")
+            for j, part in enumerate(content if isinstance(content, list) else []):
+                file_id = part.get("file_id") if part.get("type") == "input_image" else None
+                with self._lock:
+                    known = file_id in self.files
+                if file_id and not known:
+                    return _invalid(f"The file '{file_id}' does not exist.", f"input[{i}].content[{j}].file_id")
+        return None
+
+    def start(self) -> "StubBackend":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
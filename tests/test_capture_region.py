@@ -0,0 +1,160 @@
+"""
+Window lookups of capture_region against a real X server.
+
+Runs under Xvfb (skipped when it is not installed). There is no window
+manager, so the test publishes _NET_ACTIVE_WINDOW, _NET_CLIENT_LIST_STACKING
+and the per-window properties itself, the way a window manager would.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import shutil
+import subprocess
+import time
+
+import pytest
+
+import capture_region
+from capture_region import XA_ATOM, XA_CARDINAL, XA_WINDOW, CaptureSettings
+
+pytestmark = pytest.mark.skipif(
+    not shutil.which("Xvfb") or not ctypes.util.find_library("X11"),
+    reason="needs Xvfb and libX11",
+)
+
+PropModeReplace = 0
+
+
+@pytest.fixture
+def xserver(monkeypatch):
+    """Start Xvfb on a free display and point capture_region at it."""
+    for number in range(90, 110):
+        if not os.path.exists(f"/tmp/.X11-unix/X{number}"):
+            break
+    display = f":{number}"
+    server = subprocess.Popen(["Xvfb", display, "-screen", "0", "1600x1000x24", "-nolisten", "tcp"],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while not os.path.exists(f"/tmp/.X11-unix/X{number}"):
+        if time.monotonic() > deadline or server.poll() is not None:
+            server.kill()
+            pytest.skip("Xvfb did not start")
+        time.sleep(0.05)
+    monkeypatch.setenv("DISPLAY", display)
+    monkeypatch.setattr(capture_region, "_xlib", None)
+    x = capture_region._load_xlib()
+    assert x, "libX11 could not be loaded"
+    x.XCreateSimpleWindow.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_int, ctypes.c_int,
+                                      ctypes.c_uint, ctypes.c_uint, ctypes.c_uint, ctypes.c_ulong, ctypes.c_ulong]
+    x.XCreateSimpleWindow.restype = ctypes.c_ulong
+    x.XMapWindow.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+    x.XDestroyWindow.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+    x.XChangeProperty.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_ulong, ctypes.c_ulong,
+                                  ctypes.c_int, ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+    x.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    conn = x.XOpenDisplay(display.encode())
+    try:
+        yield _Desktop(x, conn)
+    finally:
+        x.XCloseDisplay(conn)
+        server.terminate()
+        server.wait(5)
+
+
+class _Desktop:
+    """Creates windows and sets the properties a window manager would."""
+
+    def __init__(self, x, conn):
+        self.x = x
+        self.conn = conn
+        self.root = x.XDefaultRootWindow(conn)
+
+    def window(self, left, top, width, height, pid=None, hidden=False) -> int:
+        window = self.x.XCreateSimpleWindow(self.conn, self.root, left, top, width, height, 0, 0, 0)
+        self.x.XMapWindow(self.conn, window)
+        self._set(window, b"_NET_WM_PID", XA_CARDINAL, [pid if pid is not None else 1])
+        if hidden:
+            self._set(window, b"_NET_WM_STATE", XA_ATOM, [self._atom(b"_NET_WM_STATE_HIDDEN")])
+        self.x.XSync(self.conn, 0)
+        return window
+
+    def publish(self, active, stacking):
+        """Set the focused window and the stacking order (bottom to top)."""
+        self._set(self.root, b"_NET_ACTIVE_WINDOW", XA_WINDOW, [active])
+        self._set(self.root, b"_NET_CLIENT_LIST_STACKING", XA_WINDOW, stacking)
+        self.x.XSync(self.conn, 0)
+
+    def destroy(self, window):
+        self.x.XDestroyWindow(self.conn, window)
+        self.x.XSync(self.conn, 0)
+
+    def _atom(self, name: bytes) -> int:
+        return self.x.XInternAtom(self.conn, name, False)
+
+    def _set(self, window, name: bytes, kind: int, values):
+        data = (ctypes.c_ulong * len(values))(*values)
+        self.x.XChangeProperty(self.conn, window, self._atom(name), kind, 32, PropModeReplace,
+                               ctypes.cast(data, ctypes.c_void_p), len(values))
+
+
+MONITORS = [
+    {"left": 0, "top": 0, "width": 1600, "height": 1000},
+    {"left": 0, "top": 0, "width": 1600, "height": 1000},
+]
+
+
+def test_focused_window(xserver):
+    editor = xserver.window(100, 50, 800, 600)
+    browser = xserver.window(300, 200, 900, 700)
+    xserver.publish(active=editor, stacking=[browser, editor])
+
+    assert capture_region.active_window() == editor
+    assert capture_region.active_window_rect() == (100, 50, 800, 600)
+
+
+def test_skips_excluded_own_and_minimized_windows(xserver):
+    editor = xserver.window(100, 50, 800, 600)
+    minimized = xserver.window(0, 0, 400, 300, hidden=True)
+    own = xserver.window(200, 200, 500, 100, pid=os.getpid())
+    terminal = xserver.window(40, 600, 700, 380)
+    xserver.publish(active=terminal, stacking=[editor, minimized, own, terminal])
+
+    # The terminal has focus, this process's window and a minimized one are on top of the editor
+    assert capture_region.active_window(exclude=(terminal,)) == editor
+
+
+def test_remembered_window_is_captured(xserver):
+    editor = xserver.window(100, 50, 800, 600)
+    assistant = xserver.window(500, 300, 600, 120, pid=os.getpid())
+    xserver.publish(active=assistant, stacking=[editor, assistant])
+
+    settings = CaptureSettings("window", window=editor)
+    assert settings.resolve(MONITORS) == {"left": 100, "top": 50, "width": 800, "height": 600}
+
+
+def test_closed_window_falls_back(xserver):
+    editor = xserver.window(100, 50, 800, 600)
+    closed = xserver.window(300, 200, 900, 700)
+    xserver.publish(active=editor, stacking=[editor, closed])
+    xserver.destroy(closed)
+
+    # A window closed since it was remembered is an X error, not a crash
+    assert capture_region.window_rect(closed) is None
+    settings = CaptureSettings("window", window=closed)
+    assert settings.resolve(MONITORS) == {"left": 100, "top": 50, "width": 800, "height": 600}
+
+
+def test_lookups_restore_the_previous_error_handler(xserver):
+    closed = xserver.window(300, 200, 900, 700)
+    xserver.destroy(closed)
+    handler = capture_region._XErrorHandler(lambda display, event: 0)
+    previous = xserver.x.XSetErrorHandler(ctypes.cast(handler, ctypes.c_void_p))
+    try:
+        assert capture_region.window_rect(closed) is None
+        assert capture_region.active_window() is None
+        # Tk's handler (here a stand-in) is back in place after each lookup
+        current = xserver.x.XSetErrorHandler(previous)
+        assert current == ctypes.cast(handler, ctypes.c_void_p).value
+    finally:
+        xserver.x.XSetErrorHandler(previous)
@@ -0,0 +1,120 @@
+"""
+Hedged requests of request_hedging against the local stub backend.
+
+The primary and the hedge go to different models so the stub can answer
+them with different latencies; each attempt's outcome is captured by
+wrapping stream_completion.
+"""
+
+import threading
+import time
+
+import httpx
+import pytest
+from openai import OpenAI
+
+import request_hedging
+from request_control import CancelToken, RequestCancelled, cancellable
+from request_hedging import HedgePolicy
+from stub_backend import StubBackend, StubReply
+
+MESSAGES = [{"role": "user", "content": "What is on my screen?"}]
+
+
+@pytest.fixture
+def backend():
+    replies = {}
+    with StubBackend(lambda body: replies[body["model"]]) as stub:
+        stub.replies = replies
+        yield stub
+
+
+class _Outcomes:
+    """Result or exception of every attempt, by model, once it has ended."""
+
+    def __init__(self):
+        self.ended = {}
+        self._done = threading.Condition()
+
+    def add(self, model, result):
+        with self._done:
+            self.ended[model] = result
+            self._done.notify_all()
+
+    def wait(self, model, timeout=5.0):
+        with self._done:
+            self._done.wait_for(lambda: model in self.ended, timeout)
+        return self.ended.get(model)
+
+
+@pytest.fixture
+def outcomes(monkeypatch):
+    recorded = _Outcomes()
+    stream_completion = request_hedging.stream_completion
+
+    def recording(client, token, on_delta=None, **kwargs):
+        try:
+            result = stream_completion(client, token, on_delta=on_delta, **kwargs)
+        except BaseException as e:
+            recorded.add(kwargs["model"], e)
+            raise
+        recorded.add(kwargs["model"], result)
+        return result
+
+    monkeypatch.setattr(request_hedging, "stream_completion", recording)
+    return recorded
+
+
+def client(backend) -> OpenAI:
+    return cancellable(OpenAI(api_key="stub", base_url=backend.base_url, max_retries=0), httpx.Client)
+
+
+def test_hedge_wins_and_primary_sample_is_censored_at_cancel(backend, outcomes):
+    backend.replies["slow"] = StubReply("primary answer", ttft=3.0)
+    backend.replies["fast"] = StubReply("hedge answer here", ttft=0.05, duration=1.0)
+    policy = HedgePolicy(model="fast", initial_delay=0.3)
+
+    started = time.perf_counter()
+    answer = policy.complete(client(backend), CancelToken(), model="slow", messages=MESSAGES)
+    elapsed = time.perf_counter() - started
+
+    assert answer == "hedge answer here"
+    assert elapsed < 2.5
+    assert policy.stats() == {"requests": 1, "hedged": 1, "hedge_wins": 1, "skipped": 0}
+    assert policy.history[-1]["winner"] == "hedge"
+    # The primary counts with the time it was cancelled, not the hedge's whole answer
+    (censored,) = policy._samples["slow"]
+    assert 0.3 <= censored < 0.8
+    # The loser is aborted while still waiting for its first token
+    assert isinstance(outcomes.wait("slow", timeout=1.0), RequestCancelled)
+
+
+def test_primary_wins_and_hedge_is_cancelled(backend, outcomes):
+    backend.replies["slow"] = StubReply("primary answer", ttft=0.5)
+    backend.replies["fast"] = StubReply("hedge answer", ttft=3.0)
+    policy = HedgePolicy(model="fast", initial_delay=0.2)
+
+    started = time.perf_counter()
+    answer = policy.complete(client(backend), CancelToken(), model="slow", messages=MESSAGES)
+    elapsed = time.perf_counter() - started
+
+    assert answer == "primary answer"
+    assert elapsed < 2.5
+    assert policy.stats()["hedge_wins"] == 0
+    assert policy.history[-1] == {**policy.history[-1], "hedged": True, "winner": "primary"}
+    (sample,) = policy._samples["slow"]
+    assert 0.5 <= sample < 1.0
+    assert isinstance(outcomes.wait("fast", timeout=1.0), RequestCancelled)
+
+
+def test_no_hedge_before_the_deadline(backend, outcomes):
+    backend.replies["slow"] = StubReply("primary answer", ttft=0.05)
+    backend.replies["fast"] = StubReply("hedge answer")
+    policy = HedgePolicy(model="fast", initial_delay=1.0)
+
+    answer = policy.complete(client(backend), CancelToken(), model="slow", messages=MESSAGES)
+
+    assert answer == "primary answer"
+    assert policy.stats() == {"requests": 1, "hedged": 0, "hedge_wins": 0, "skipped": 0}
+    assert outcomes.wait("slow") == "primary answer"
+    assert "fast" not in outcomes.ended